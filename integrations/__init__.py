@@ -3,6 +3,11 @@ vision-ai-ocr-guide integrations package.
 """
 
 from .gcs_loader import GCSDocumentProcessor
-from .bigquery_export import BigQueryExporter, export_to_warehouse
+from .bigquery_export import BigQueryExporter, BigQueryStorageExporter, export_to_warehouse
 
-__all__ = ["GCSDocumentProcessor", "BigQueryExporter", "export_to_warehouse"]
+__all__ = [
+    "GCSDocumentProcessor",
+    "BigQueryExporter",
+    "BigQueryStorageExporter",
+    "export_to_warehouse",
+]
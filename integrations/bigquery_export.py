@@ -2,16 +2,25 @@
 bigquery_export.py - Stream OCR extraction results to a BigQuery data warehouse.
 
 Schema is auto-created on first run. Supports both single-record inserts and
-bulk streaming for high-throughput pipelines.
+bulk streaming for high-throughput pipelines, either through the legacy
+insertAll endpoint or the Storage Write API.
 """
 
 import json
 import logging
-from datetime import datetime
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from operator import itemgetter
 from typing import List, Optional
 
 from google.cloud import bigquery
-from google.api_core.exceptions import NotFound
+from google.cloud import bigquery_storage_v1
+from google.cloud.bigquery_storage_v1 import types, writer
+from google.cloud.bigquery_storage_v1.exceptions import StreamClosedError
+from google.api_core.exceptions import InternalServerError, NotFound, ServiceUnavailable
+from google.protobuf import descriptor_pb2, descriptor_pool, message_factory
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
 logger = logging.getLogger(__name__)
@@ -32,6 +41,48 @@ OCR_RESULTS_SCHEMA = [
     bigquery.SchemaField("page_count", "INTEGER"),
 ]
 
+# Verified table metadata, keyed by fully-qualified table ref: (expires_at, Table).
+# Avoids a get_table round-trip on every export in high-frequency pipelines.
+# When full, expired entries are pruned first, then the oldest are dropped.
+TABLE_CACHE_TTL_SECONDS = 300
+TABLE_CACHE_MAX_ENTRIES = 256
+_table_cache = {}
+_table_cache_lock = threading.Lock()
+
+# insertAll guidance: ~500 rows per request; chunks are sent concurrently
+EXPORT_CHUNK_SIZE = 500
+EXPORT_PARALLELISM = 8
+
+# AppendRowsRequest is capped at 10 MB; the headroom covers the writer schema
+# sent with a stream's first request and per-row framing.
+APPEND_MAX_BYTES = 9 * 1024 * 1024
+
+# BigQuery column type -> proto2 field type for Storage Write API rows.
+# TIMESTAMP columns are written as microseconds since the Unix epoch.
+_PROTO_FIELD_TYPES = {
+    "STRING": descriptor_pb2.FieldDescriptorProto.TYPE_STRING,
+    "FLOAT64": descriptor_pb2.FieldDescriptorProto.TYPE_DOUBLE,
+    "FLOAT": descriptor_pb2.FieldDescriptorProto.TYPE_DOUBLE,
+    "INTEGER": descriptor_pb2.FieldDescriptorProto.TYPE_INT64,
+    "INT64": descriptor_pb2.FieldDescriptorProto.TYPE_INT64,
+    "BOOLEAN": descriptor_pb2.FieldDescriptorProto.TYPE_BOOL,
+    "TIMESTAMP": descriptor_pb2.FieldDescriptorProto.TYPE_INT64,
+}
+
+# Storage Write API connections shared by every BigQueryStorageExporter.
+# Append streams are cached per table ref and multiplexed over a bounded pool
+# of write clients (one gRPC channel each), so warm exports skip stream setup.
+# The bounds are process-wide, since the pool is; set them before first use.
+WRITE_POOL_MIN_CLIENTS = 2
+WRITE_POOL_MAX_CLIENTS = 10
+_write_clients = []
+_write_streams = {}
+_write_stream_locks = {}
+_write_pool_lock = threading.Lock()
+
+# Append failures that mean the stream is unusable rather than the rows bad
+_RETRYABLE_APPEND_ERRORS = (ServiceUnavailable, InternalServerError, StreamClosedError)
+
 
 class BigQueryExporter:
     """
@@ -54,6 +105,7 @@ class BigQueryExporter:
         self.dataset_id = dataset_id
         self.table_id = table_id
         self.table_ref = f"{self.client.project}.{dataset_id}.{table_id}"
+        self._read_client = None
 
     # ------------------------------------------------------------------
     # Table management
@@ -63,12 +115,36 @@ class BigQueryExporter:
         """
         Create the BigQuery table if it does not already exist.
 
+        Successful lookups are cached for TABLE_CACHE_TTL_SECONDS per table
+        ref, so repeated calls within that window make no API requests.
+
         Args:
             schema: Optional custom schema. Defaults to OCR_RESULTS_SCHEMA.
+                    Only used when the table is created; an existing or
+                    cached table is returned as is, whatever its schema.
 
         Returns:
             The existing or newly created BigQuery Table object.
         """
+        now = time.monotonic()
+        with _table_cache_lock:
+            cached = _table_cache.get(self.table_ref)
+        if cached and cached[0] > now:
+            return cached[1]
+
+        table = self._ensure_table_exists_uncached(schema)
+        with _table_cache_lock:
+            _table_cache.pop(self.table_ref, None)
+            if len(_table_cache) >= TABLE_CACHE_MAX_ENTRIES:
+                for ref in [r for r, (expires_at, _) in _table_cache.items() if expires_at <= now]:
+                    del _table_cache[ref]
+                # Dicts keep insertion order, so the first entries are the oldest
+                while len(_table_cache) >= TABLE_CACHE_MAX_ENTRIES:
+                    del _table_cache[next(iter(_table_cache))]
+            _table_cache[self.table_ref] = (now + TABLE_CACHE_TTL_SECONDS, table)
+        return table
+
+    def _ensure_table_exists_uncached(self, schema: list = None) -> bigquery.Table:
         try:
             table = self.client.get_table(self.table_ref)
             logger.info(f"Table exists: {self.table_ref}")
@@ -95,25 +171,52 @@ class BigQueryExporter:
     # Export methods
     # ------------------------------------------------------------------
 
-    def export(self, extraction_results: List[dict]) -> int:
+    def export(
+        self,
+        extraction_results: List[dict],
+        chunk_size: int = EXPORT_CHUNK_SIZE,
+        parallelism: int = EXPORT_PARALLELISM,
+    ) -> int:
         """
         Stream a list of OCR results to BigQuery.
 
+        Rows are sent in insertAll requests of at most chunk_size rows, with
+        up to `parallelism` requests in flight.
+
         Args:
             extraction_results: List of dicts as returned by DocumentExtractor.
+            chunk_size:         Maximum rows per insert request.
+            parallelism:        Maximum concurrent insert requests.
 
         Returns:
             Number of rows successfully inserted.
 
         Raises:
-            RuntimeError: If BigQuery reports insert errors.
+            RuntimeError: If BigQuery reports insert errors. Row indexes in the
+                          message refer to positions in extraction_results.
         """
         if not extraction_results:
             logger.warning("No results to export.")
             return 0
 
         rows = [self._to_bq_row(r) for r in extraction_results]
-        errors = self.client.insert_rows_json(self.table_ref, rows)
+        starts = range(0, len(rows), chunk_size)
+
+        def insert_chunk(start: int) -> list:
+            chunk_errors = self.client.insert_rows_json(
+                self.table_ref, rows[start:start + chunk_size]
+            )
+            for error in chunk_errors:
+                error["index"] = error.get("index", 0) + start
+            return chunk_errors
+
+        errors = []
+        if len(starts) == 1:
+            errors.extend(insert_chunk(0))
+        else:
+            with ThreadPoolExecutor(max_workers=min(parallelism, len(starts))) as executor:
+                for chunk_errors in executor.map(insert_chunk, starts):
+                    errors.extend(chunk_errors)
 
         if errors:
             raise RuntimeError(f"BigQuery insert errors: {json.dumps(errors, indent=2)}")
@@ -141,8 +244,7 @@ class BigQueryExporter:
             ORDER BY processing_time DESC
             LIMIT {limit}
         """
-        results = self.client.query(query).result()
-        return [dict(row) for row in results]
+        return self._fetch_rows(self.client.query(query))
 
     def search_text(self, keyword: str, limit: int = 50) -> List[dict]:
         """
@@ -167,13 +269,24 @@ class BigQueryExporter:
                 bigquery.ScalarQueryParameter("keyword", "STRING", f"%{keyword}%")
             ]
         )
-        results = self.client.query(query, job_config=job_config).result()
-        return [dict(row) for row in results]
+        return self._fetch_rows(self.client.query(query, job_config=job_config))
 
     # ------------------------------------------------------------------
     # Private helpers
     # ------------------------------------------------------------------
 
+    def _fetch_rows(self, query_job) -> List[dict]:
+        """
+        Download query results through the BigQuery Storage Read API.
+
+        Rows arrive as Arrow record batches over gRPC rather than paged JSON
+        from jobs.getQueryResults; the read client is created on first use.
+        """
+        if self._read_client is None:
+            self._read_client = bigquery_storage_v1.BigQueryReadClient()
+        table = query_job.result().to_arrow(bqstorage_client=self._read_client)
+        return table.to_pylist()
+
     def _to_bq_row(self, result: dict) -> dict:
         return {
             "document_uri": result.get("source") or result.get("gcs_uri") or "",
@@ -197,10 +310,290 @@ class BigQueryExporter:
         return ext or None
 
 
+class BigQueryStorageExporter(BigQueryExporter):
+    """
+    BigQueryExporter that appends rows through the Storage Write API.
+
+    Rows are serialized as protobuf messages and sent on the table's
+    ``_default`` stream, avoiding the rate limits and per-row cost of the
+    legacy ``tabledata.insertAll`` endpoint used by BigQueryExporter.
+    Append streams are cached per table and shared by all instances in the
+    process; streams for different tables are multiplexed over a process-wide
+    pool of WRITE_POOL_MIN_CLIENTS to WRITE_POOL_MAX_CLIENTS write clients.
+
+    Usage:
+        exporter = BigQueryStorageExporter(dataset_id="ocr_warehouse", table_id="results")
+        exporter.ensure_table_exists()
+        exporter.export(results_list)
+    """
+
+    def __init__(self, dataset_id: str, table_id: str, project_id: str = None):
+        """
+        Args:
+            dataset_id: BigQuery dataset name.
+            table_id:   BigQuery table name.
+            project_id: GCP project ID. Defaults to the client's inferred project.
+        """
+        super().__init__(dataset_id, table_id, project_id)
+        self._descriptor, self._row_class = _build_row_message(OCR_RESULTS_SCHEMA)
+
+    def export(
+        self,
+        extraction_results: List[dict],
+        chunk_size: int = EXPORT_CHUNK_SIZE,
+        parallelism: int = EXPORT_PARALLELISM,
+    ) -> int:
+        """
+        Append a list of OCR results to BigQuery via the Storage Write API.
+
+        Rows are split into AppendRowsRequests of at most chunk_size rows and
+        APPEND_MAX_BYTES of serialized data, with up to `parallelism` appends
+        in flight on the table's stream. Appends that fail with
+        Unavailable/Internal, or because the server has already closed the
+        stream, are retried once on a fresh stream.
+
+        Args:
+            extraction_results: List of dicts as returned by DocumentExtractor.
+            chunk_size:         Maximum rows per append request.
+            parallelism:        Maximum concurrent append requests.
+
+        Returns:
+            Number of rows successfully appended.
+
+        Raises:
+            RuntimeError: If BigQuery reports row errors. Row indexes in the
+                          message refer to positions in extraction_results.
+        """
+        if not extraction_results:
+            logger.warning("No results to export.")
+            return 0
+
+        serialized = [self._serialize_row(self._to_bq_row(r)) for r in extraction_results]
+        pending = _split_appends(serialized, chunk_size, APPEND_MAX_BYTES)
+
+        errors = []
+        with self._table_lock():
+            for attempt in range(2):
+                failed, last_exc = self._send_appends(pending, max(parallelism, 1), errors)
+                if not failed:
+                    break
+                if attempt:
+                    raise last_exc
+                logger.warning(f"Write stream failed ({last_exc}); reconnecting")
+                self._close_stream()
+                pending = failed
+
+        if errors:
+            raise RuntimeError(f"BigQuery append errors: {json.dumps(errors, indent=2)}")
+
+        logger.info(f"Appended {len(serialized)} row(s) to {self.table_ref}")
+        return len(serialized)
+
+    def close(self) -> None:
+        """Close the shared append stream for this table, if open."""
+        with self._table_lock():
+            self._close_stream()
+
+    # ------------------------------------------------------------------
+    # Private helpers
+    # ------------------------------------------------------------------
+
+    def _table_lock(self) -> threading.Lock:
+        with _write_pool_lock:
+            return _write_stream_locks.setdefault(self.table_ref, threading.Lock())
+
+    def _send_appends(self, appends: list, parallelism: int, errors: list):
+        """
+        Send (start, rows) appends in windows of `parallelism` and collect row
+        errors into errors. Caller must hold the table lock.
+
+        Returns:
+            (appends that failed with a retryable error and were not
+             acknowledged, the last such error).
+        """
+        for i in range(0, len(appends), parallelism):
+            window = appends[i:i + parallelism]
+            failed, last_exc, sent = [], None, []
+            for start, rows in window:
+                request = types.AppendRowsRequest(
+                    proto_rows=types.AppendRowsRequest.ProtoData(
+                        rows=types.ProtoRows(serialized_rows=rows)
+                    )
+                )
+                try:
+                    sent.append((start, rows, self._get_stream().send(request)))
+                except _RETRYABLE_APPEND_ERRORS as exc:
+                    failed.append((start, rows))
+                    last_exc = exc
+
+            for start, rows, future in sent:
+                try:
+                    response = future.result()
+                except _RETRYABLE_APPEND_ERRORS as exc:
+                    failed.append((start, rows))
+                    last_exc = exc
+                    continue
+                errors.extend(
+                    {"index": e.index + start, "message": e.message}
+                    for e in response.row_errors
+                )
+
+            if failed:
+                # Stop on the broken stream; the rest is resent after reconnecting
+                return sorted(failed, key=itemgetter(0)) + appends[i + parallelism:], last_exc
+        return [], None
+
+    def _get_stream(self) -> writer.AppendRowsStream:
+        with _write_pool_lock:
+            # Streams that close are evicted by their close callback
+            stream = _write_streams.get(self.table_ref)
+            if stream is not None:
+                return stream
+
+            write_client = _acquire_write_client()
+            table_path = write_client.table_path(
+                self.client.project, self.dataset_id, self.table_id
+            )
+            template = types.AppendRowsRequest(
+                write_stream=f"{table_path}/streams/_default",
+                proto_rows=types.AppendRowsRequest.ProtoData(
+                    writer_schema=types.ProtoSchema(proto_descriptor=self._descriptor)
+                ),
+            )
+            stream = writer.AppendRowsStream(write_client, template)
+            stream.add_close_callback(_evict_stream_on_close(self.table_ref))
+            _write_streams[self.table_ref] = stream
+            return stream
+
+    def _close_stream(self) -> None:
+        with _write_pool_lock:
+            stream = _write_streams.pop(self.table_ref, None)
+        if stream is not None:
+            try:
+                stream.close()
+            except Exception as exc:
+                logger.warning(f"Error closing write stream: {exc}")
+
+    def _serialize_row(self, row: dict) -> bytes:
+        message = self._row_class()
+        for field in OCR_RESULTS_SCHEMA:
+            value = row.get(field.name)
+            if value is None:
+                continue
+            if field.field_type == "TIMESTAMP":
+                value = _to_epoch_micros(value)
+            setattr(message, field.name, value)
+        return message.SerializeToString()
+
+
+def _split_appends(serialized_rows: list, max_rows: int, max_bytes: int) -> list:
+    """
+    Group serialized rows into (start index, rows) appends of at most max_rows
+    rows and max_bytes bytes. A single row larger than max_bytes is sent alone
+    and left for the server to reject.
+    """
+    appends = []
+    start, size = 0, 0
+    for i, row in enumerate(serialized_rows):
+        if i > start and (i - start >= max_rows or size + len(row) > max_bytes):
+            appends.append((start, serialized_rows[start:i]))
+            start, size = i, 0
+        size += len(row)
+    appends.append((start, serialized_rows[start:]))
+    return appends
+
+
+def _acquire_write_client():
+    """
+    Pick a write client for a new stream. Caller must hold _write_pool_lock.
+
+    Clients are created lazily: the first stream fills the pool to
+    WRITE_POOL_MIN_CLIENTS, then each new stream adds one client until
+    WRITE_POOL_MAX_CLIENTS; beyond that streams share clients round-robin.
+    """
+    while len(_write_clients) < WRITE_POOL_MIN_CLIENTS:
+        _write_clients.append(bigquery_storage_v1.BigQueryWriteClient())
+    if (
+        len(_write_clients) < WRITE_POOL_MAX_CLIENTS
+        and len(_write_streams) >= len(_write_clients)
+    ):
+        _write_clients.append(bigquery_storage_v1.BigQueryWriteClient())
+    return _write_clients[len(_write_streams) % len(_write_clients)]
+
+
+def _evict_stream_on_close(table_ref: str):
+    """
+    Build an AppendRowsStream close callback that drops the stream from the
+    shared cache, so a stream the server ends (e.g. an idle close) is replaced
+    on the next export instead of failing every send with StreamClosedError.
+    """
+    def on_close(stream, reason=None):
+        with _write_pool_lock:
+            if _write_streams.get(table_ref) is stream:
+                del _write_streams[table_ref]
+        if reason is not None:
+            logger.info(f"Write stream for {table_ref} closed: {reason}")
+
+    return on_close
+
+
+def _build_row_message(schema: list):
+    """
+    Build a proto2 DescriptorProto and message class mirroring a BigQuery schema.
+
+    Returns:
+        Tuple of (DescriptorProto, generated message class).
+    """
+    file_proto = descriptor_pb2.FileDescriptorProto(
+        name="ocr_result_row.proto", package="ocr", syntax="proto2"
+    )
+    message_proto = file_proto.message_type.add(name="OcrResultRow")
+    for number, field in enumerate(schema, start=1):
+        message_proto.field.add(
+            name=field.name,
+            number=number,
+            type=_PROTO_FIELD_TYPES[field.field_type],
+            label=(
+                descriptor_pb2.FieldDescriptorProto.LABEL_REQUIRED
+                if field.mode == "REQUIRED"
+                else descriptor_pb2.FieldDescriptorProto.LABEL_OPTIONAL
+            ),
+        )
+
+    pool = descriptor_pool.DescriptorPool()
+    pool.Add(file_proto)
+    row_class = message_factory.GetMessageClass(pool.FindMessageTypeByName("ocr.OcrResultRow"))
+    return message_proto, row_class
+
+
+def _to_epoch_micros(value) -> int:
+    """Convert a datetime or ISO-8601 string to microseconds since the epoch."""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp() * 1_000_000)
+
+
 # ---------------------------------------------------------------------------
 # Convenience function (matches guide usage)
 # ---------------------------------------------------------------------------
 
+_exporters = {}
+_exporters_lock = threading.Lock()
+
+
+def _get_exporter(dataset_id: str, table_id: str, project_id: str = None) -> BigQueryExporter:
+    """Return a shared exporter per destination so clients are built once."""
+    key = (dataset_id, table_id, project_id)
+    with _exporters_lock:
+        exporter = _exporters.get(key)
+        if exporter is None:
+            exporter = BigQueryExporter(dataset_id, table_id, project_id)
+            _exporters[key] = exporter
+    return exporter
+
+
 def export_to_warehouse(
     extraction_results: list,
     dataset_id: str,
@@ -216,6 +609,6 @@ def export_to_warehouse(
         table_id:           BigQuery table name.
         project_id:         GCP project (optional).
     """
-    exporter = BigQueryExporter(dataset_id, table_id, project_id)
+    exporter = _get_exporter(dataset_id, table_id, project_id)
     exporter.ensure_table_exists()
     exporter.export(extraction_results)
@@ -5,18 +5,82 @@ Provides:
 - Triggered Cloud Function handler (GCS → OCR → GCS)
 - Batch download helper for processing GCS-hosted documents locally
 - Direct GCS URI OCR (no download required)
+- Bucket-wide OCR via Vision's async batch annotation
 """
 
 import json
 import logging
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
+from functools import lru_cache
 from typing import List
 
+import google.auth
+from google.auth.transport.requests import AuthorizedSession
 from google.cloud import storage, vision
+from requests.adapters import HTTPAdapter
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
 logger = logging.getLogger(__name__)
 
+# Vision limits: 2000 images per async image batch, 100 responses per output shard
+MAX_BATCH_IMAGES = 2000
+OUTPUT_SHARD_SIZE = 100
+BATCH_TIMEOUT_SECONDS = 1800
+SHARD_READER_WORKERS = 4
+
+# Concurrent result uploads, and the HTTP connection pool backing them
+UPLOAD_WORKERS = 16
+# Concurrent Vision calls in the per-image (non-batch) bucket pipeline
+PIPELINE_OCR_WORKERS = 16
+HTTP_POOL_SIZE = 32
+
+# Compact separators: result JSON is machine-read, indentation only adds bytes
+JSON_SEPARATORS = (",", ":")
+
+_WORD_RE = re.compile(r"\S+")
+
+
+def _count_words(text: str) -> int:
+    """Count whitespace-separated words without materializing a token list."""
+    return sum(1 for _ in _WORD_RE.finditer(text))
+
+
+# Image extensions handled by bucket-wide OCR, filtered server-side via matchGlob.
+# Globs are case-sensitive, so each letter becomes a [xX] class to match any
+# mixture of cases (e.g. "Scan.Jpg"), as the old .lower() filter did.
+SUPPORTED_IMAGE_EXTENSIONS = ("jpg", "jpeg", "png", "gif", "bmp", "webp", "tiff")
+IMAGE_MATCH_GLOB = "**.{%s}" % ",".join(
+    "".join(f"[{c}{c.upper()}]" for c in ext) for ext in SUPPORTED_IMAGE_EXTENSIONS
+)
+
+
+# ---------------------------------------------------------------------------
+# Shared clients
+# ---------------------------------------------------------------------------
+# Built on first use and kept for the life of the process, so warm Cloud
+# Function instances and every GCSDocumentProcessor reuse the same channels
+# and credentials instead of bootstrapping them per invocation.
+
+@lru_cache(maxsize=1)
+def _get_vision_client() -> vision.ImageAnnotatorClient:
+    return vision.ImageAnnotatorClient()
+
+
+@lru_cache(maxsize=1)
+def _get_storage_client() -> storage.Client:
+    credentials, project = google.auth.default(scopes=storage.Client.SCOPE)
+    session = AuthorizedSession(credentials)
+    # The default requests pool (10 connections) would throttle UPLOAD_WORKERS
+    session.mount(
+        "https://",
+        HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE),
+    )
+    # _http is a private constructor argument (kept stable through 2.x); the
+    # google-cloud-storage pin in requirements.txt guards against it changing.
+    return storage.Client(project=project, credentials=credentials, _http=session)
+
 
 # ---------------------------------------------------------------------------
 # Cloud Function entry point
@@ -46,8 +110,8 @@ def gcs_ocr_trigger(event: dict, context) -> None:
 
     logger.info(f"Processing: gs://{bucket_name}/{file_name}")
 
-    vision_client = vision.ImageAnnotatorClient()
-    storage_client = storage.Client()
+    vision_client = _get_vision_client()
+    storage_client = _get_storage_client()
 
     # Reference the file directly in GCS — no download needed
     image = vision.Image(
@@ -72,7 +136,7 @@ def gcs_ocr_trigger(event: dict, context) -> None:
         "source": file_name,
         "bucket": bucket_name,
         "text": extracted_text,
-        "word_count": len(extracted_text.split()) if extracted_text else 0,
+        "word_count": _count_words(extracted_text),
         "timestamp": context.timestamp,
         "processed_at": datetime.utcnow().isoformat(),
     }
@@ -81,7 +145,7 @@ def gcs_ocr_trigger(event: dict, context) -> None:
     bucket = storage_client.bucket(bucket_name)
     output_blob = bucket.blob(output_blob_name)
     output_blob.upload_from_string(
-        json.dumps(result, indent=2),
+        json.dumps(result, separators=JSON_SEPARATORS),
         content_type="application/json",
     )
 
@@ -98,8 +162,8 @@ class GCSDocumentProcessor:
     """
 
     def __init__(self):
-        self.vision_client = vision.ImageAnnotatorClient()
-        self.storage_client = storage.Client()
+        self.vision_client = _get_vision_client()
+        self.storage_client = _get_storage_client()
 
     def extract_from_gcs(self, gcs_uri: str, language: str = "en") -> dict:
         """
@@ -132,7 +196,7 @@ class GCSDocumentProcessor:
         return {
             "gcs_uri": gcs_uri,
             "text": text,
-            "word_count": len(text.split()) if text else 0,
+            "word_count": _count_words(text),
         }
 
     def batch_extract_from_bucket(
@@ -141,47 +205,198 @@ class GCSDocumentProcessor:
         prefix: str = "",
         output_bucket: str = None,
         output_prefix: str = "ocr-results/",
+        language: str = "en",
+        batch: bool = True,
     ) -> List[dict]:
         """
         Process all supported images in a GCS bucket (or prefix/folder).
 
+        Images are annotated server-side with AsyncBatchAnnotateImages in
+        chunks of up to MAX_BATCH_IMAGES; Vision writes raw response shards
+        under '<output_prefix>_batch/', which are then parsed into per-image
+        result JSON files and deleted. With batch=False each image gets its
+        own Vision call instead, with calls and result uploads overlapped in
+        thread pools.
+
         Args:
             bucket_name:   Source bucket name.
             prefix:        Optional folder prefix to filter files.
             output_bucket: Bucket to write results to (defaults to same bucket).
             output_prefix: Prefix for output JSON files.
+            language:      BCP-47 language hint.
+            batch:         Use async batch annotation (requires write access to
+                           output_bucket for the intermediate shards).
 
         Returns:
             List of extraction result dictionaries.
         """
-        SUPPORTED = {".jpg", ".jpeg", ".png", ".gif", ".bmp", ".webp", ".tiff"}
-
         bucket = self.storage_client.bucket(bucket_name)
-        blobs = [
-            b for b in bucket.list_blobs(prefix=prefix)
-            if any(b.name.lower().endswith(ext) for ext in SUPPORTED)
-        ]
+        blobs = list(bucket.list_blobs(prefix=prefix, match_glob=IMAGE_MATCH_GLOB))
 
         logger.info(f"Found {len(blobs)} image(s) in gs://{bucket_name}/{prefix}")
 
         out_bucket_name = output_bucket or bucket_name
         out_bucket = self.storage_client.bucket(out_bucket_name)
 
+        if not batch:
+            return self._extract_pipelined(
+                bucket_name, blobs, out_bucket, output_prefix, language
+            )
+
+        run_id = datetime.utcnow().strftime("%Y%m%dT%H%M%S%f")
+
         results = []
-        for blob in blobs:
-            gcs_uri = f"gs://{bucket_name}/{blob.name}"
+        for start in range(0, len(blobs), MAX_BATCH_IMAGES):
+            chunk = blobs[start:start + MAX_BATCH_IMAGES]
+            shard_prefix = f"{output_prefix}_batch/{run_id}/{start}/"
             try:
-                result = self.extract_from_gcs(gcs_uri)
-                results.append(result)
+                results.extend(
+                    self._annotate_chunk(
+                        bucket_name, chunk, out_bucket, shard_prefix, output_prefix, language
+                    )
+                )
+            except Exception as exc:
+                logger.error(f"✗ batch of {len(chunk)} image(s) from {chunk[0].name}: {exc}")
+
+        return results
+
+    # ------------------------------------------------------------------
+    # Private helpers
+    # ------------------------------------------------------------------
 
-                out_name = f"{output_prefix}{blob.name}.json"
-                out_blob = out_bucket.blob(out_name)
-                out_blob.upload_from_string(
-                    json.dumps(result, indent=2),
+    def _extract_pipelined(
+        self, bucket_name, blobs, out_bucket, output_prefix, language
+    ) -> List[dict]:
+        """
+        Per-image OCR with Vision calls and result uploads run as a pipeline.
+
+        Each finished OCR result is handed to the upload pool straight away,
+        so uploads for earlier images overlap with Vision calls for later ones.
+        """
+        uploads = []
+        with ThreadPoolExecutor(max_workers=PIPELINE_OCR_WORKERS) as ocr_pool, \
+                ThreadPoolExecutor(max_workers=UPLOAD_WORKERS) as uploader:
+            future_to_blob = {
+                ocr_pool.submit(
+                    self.extract_from_gcs, f"gs://{bucket_name}/{blob.name}", language
+                ): blob
+                for blob in blobs
+            }
+            for future in as_completed(future_to_blob):
+                blob = future_to_blob[future]
+                try:
+                    result = future.result()
+                except Exception as exc:
+                    logger.error(f"✗ {blob.name}: {exc}")
+                    continue
+
+                out_blob = out_bucket.blob(f"{output_prefix}{blob.name}.json")
+                upload = uploader.submit(
+                    out_blob.upload_from_string,
+                    json.dumps(result, separators=JSON_SEPARATORS),
                     content_type="application/json",
                 )
-                logger.info(f"✓ {blob.name}")
+                uploads.append((blob.name, result, upload))
+
+        return self._collect_uploads(uploads)
+
+    def _annotate_chunk(
+        self, bucket_name, blobs, out_bucket, shard_prefix, output_prefix, language
+    ) -> List[dict]:
+        """Run one AsyncBatchAnnotateImages operation and parse its output shards."""
+        context = vision.ImageContext(language_hints=[language])
+        requests = [
+            vision.AnnotateImageRequest(
+                image=vision.Image(
+                    source=vision.ImageSource(gcs_image_uri=f"gs://{bucket_name}/{blob.name}")
+                ),
+                features=[vision.Feature(type_=vision.Feature.Type.TEXT_DETECTION)],
+                image_context=context,
+            )
+            for blob in blobs
+        ]
+        output_config = vision.OutputConfig(
+            gcs_destination=vision.GcsDestination(uri=f"gs://{out_bucket.name}/{shard_prefix}"),
+            batch_size=OUTPUT_SHARD_SIZE,
+        )
+
+        operation = self.vision_client.async_batch_annotate_images(
+            requests=requests, output_config=output_config
+        )
+        operation.result(timeout=BATCH_TIMEOUT_SECONDS)
+
+        shards = list(out_bucket.list_blobs(prefix=shard_prefix))
+        uploads = []
+        try:
+            with ThreadPoolExecutor(max_workers=SHARD_READER_WORKERS) as readers, \
+                    ThreadPoolExecutor(max_workers=UPLOAD_WORKERS) as uploader:
+                for shard_uploads in readers.map(
+                    lambda shard: self._read_shard(
+                        shard, bucket_name, out_bucket, output_prefix, uploader
+                    ),
+                    shards,
+                ):
+                    uploads.extend(shard_uploads)
+        finally:
+            # Raw shards have a different schema from the per-image results;
+            # don't leave them under output_prefix once they have been parsed.
+            try:
+                out_bucket.delete_blobs(shards)
             except Exception as exc:
-                logger.error(f"✗ {blob.name}: {exc}")
+                logger.warning(f"Could not delete batch shards under {shard_prefix}: {exc}")
+
+        return self._collect_uploads(uploads)
 
+    @staticmethod
+    def _collect_uploads(uploads: list) -> List[dict]:
+        """Wait on (blob_name, result, upload_future) tuples; keep successful results."""
+        results = []
+        for blob_name, result, future in uploads:
+            try:
+                future.result()
+                results.append(result)
+                logger.info(f"✓ {blob_name}")
+            except Exception as exc:
+                logger.error(f"✗ {blob_name}: {exc}")
         return results
+
+    def _read_shard(self, shard, bucket_name, out_bucket, output_prefix, uploader) -> list:
+        """
+        Parse one Vision output shard and submit a result JSON upload per image.
+
+        Returns:
+            List of (blob_name, result, upload_future) tuples.
+        """
+        response_batch = vision.BatchAnnotateImagesResponse.from_json(
+            shard.download_as_bytes(), ignore_unknown_fields=True
+        )
+        source_prefix = f"gs://{bucket_name}/"
+
+        uploads = []
+        for response in response_batch.responses:
+            gcs_uri = response.context.uri
+            blob_name = gcs_uri[len(source_prefix):]
+            if response.error.message:
+                logger.error(f"✗ {blob_name}: Vision API error: {response.error.message}")
+                continue
+
+            text = (
+                response.text_annotations[0].description
+                if response.text_annotations
+                else ""
+            )
+            result = {
+                "gcs_uri": gcs_uri,
+                "text": text,
+                "word_count": _count_words(text),
+            }
+
+            out_blob = out_bucket.blob(f"{output_prefix}{blob_name}.json")
+            future = uploader.submit(
+                out_blob.upload_from_string,
+                json.dumps(result, separators=JSON_SEPARATORS),
+                content_type="application/json",
+            )
+            uploads.append((blob_name, result, future))
+
+        return uploads
@@ -6,5 +6,13 @@ from .ocr import DocumentExtractor
 from .batch_processor import BatchProcessor
 from .handwriting import HandwritingExtractor
 from .layout_analyzer import LayoutAnalyzer
+from .combined import CombinedAnalysis, analyze_all
 
-__all__ = ["DocumentExtractor", "BatchProcessor", "HandwritingExtractor", "LayoutAnalyzer"]
+__all__ = [
+    "DocumentExtractor",
+    "BatchProcessor",
+    "HandwritingExtractor",
+    "LayoutAnalyzer",
+    "CombinedAnalysis",
+    "analyze_all",
+]
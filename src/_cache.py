@@ -0,0 +1,57 @@
+"""
+_cache.py - On-disk JSON result cache keyed by content digest.
+Shared by DocumentExtractor, HandwritingExtractor and BatchProcessor.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+
+# Files are hashed in 1 MiB reads so large PDFs are never held in memory whole
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def content_digest(content: bytes) -> str:
+    """BLAKE2b digest of in-memory content, as used in cache keys."""
+    return hashlib.blake2b(content, digest_size=16).hexdigest()
+
+
+def file_digest(path) -> str:
+    """BLAKE2b digest of a file's contents, read in HASH_CHUNK_SIZE pieces."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    Directory of '<key>.json' result files.
+
+    Entries are written to a temporary file that replaces the target, so
+    concurrent readers and writers never observe a partial result.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = Path(cache_dir)
+
+    def load(self, key: str):
+        """Return the cached result for key, or None on a miss."""
+        try:
+            with open(self.cache_dir / f"{key}.json", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def store(self, key: str, result: dict):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.cache_dir / f".{key}.{threading.get_ident()}.tmp"
+        try:
+            tmp_file.write_bytes(json.dumps(result, ensure_ascii=False).encode("utf-8"))
+            os.replace(tmp_file, self.cache_dir / f"{key}.json")
+        except BaseException:
+            tmp_file.unlink(missing_ok=True)
+            raise
@@ -0,0 +1,191 @@
+"""
+_vision.py - Vision API plumbing shared by the OCR, handwriting and layout modules.
+Lazy import of google.cloud.vision, image loading, detail-level response field
+masks, the process-wide client, and cached BatchAnnotateImages calls.
+"""
+
+import logging
+import os
+from functools import lru_cache
+from operator import attrgetter
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from google.cloud import vision
+
+logger = logging.getLogger(__name__)
+
+# Vision accepts at most 16 images per BatchAnnotateImages request
+MAX_IMAGES_PER_REQUEST = 16
+
+# google.cloud.vision pulls in gRPC and protobuf, which dominates import time.
+# It is imported on first use so CLI argument and path errors surface without it.
+_vision = None
+
+
+def require_vision():
+    """Import google.cloud.vision on first use and return the module."""
+    global _vision
+    if _vision is None:
+        from google.cloud import vision
+
+        _vision = vision
+    return _vision
+
+
+def is_path(source) -> bool:
+    return isinstance(source, (str, os.PathLike))
+
+
+def load_image(source) -> "vision.Image":
+    """
+    Return source unchanged if it is already a vision.Image, otherwise read
+    the file at that path into one.
+
+    Passing the same vision.Image to DocumentExtractor, HandwritingExtractor
+    and LayoutAnalyzer avoids reading the file from disk more than once.
+
+    Raises:
+        FileNotFoundError: If the file does not exist.
+    """
+    if not is_path(source):
+        return source
+
+    path = Path(source)
+    if not path.exists():
+        raise FileNotFoundError(f"File not found: {source}")
+    return require_vision().Image(content=path.read_bytes())
+
+
+def source_name(source) -> str:
+    return Path(source).name if is_path(source) else "<image>"
+
+
+# Word text is the concatenation of its symbols; map() with a C-level getter
+# avoids a generator frame and attribute lookup per symbol on dense pages.
+symbol_text = attrgetter("text")
+
+
+# Granularity of the annotation tree to request, coarsest first.
+DETAIL_LEVELS = ("page", "block", "word", "symbol")
+
+_PAGE_FIELDS = [
+    "responses.error",
+    "responses.full_text_annotation.text",
+    "responses.full_text_annotation.pages.width",
+    "responses.full_text_annotation.pages.height",
+    "responses.full_text_annotation.pages.confidence",
+    "responses.full_text_annotation.pages.property",
+]
+_BLOCK_FIELDS = _PAGE_FIELDS + [
+    "responses.full_text_annotation.pages.blocks.bounding_box",
+    "responses.full_text_annotation.pages.blocks.block_type",
+    "responses.full_text_annotation.pages.blocks.confidence",
+]
+_WORD_FIELDS = _BLOCK_FIELDS + [
+    "responses.full_text_annotation.pages.blocks.paragraphs.words.bounding_box",
+    "responses.full_text_annotation.pages.blocks.paragraphs.words.confidence",
+    "responses.full_text_annotation.pages.blocks.paragraphs.words.symbols.text",
+]
+
+# Response field masks per detail level, sent as x-goog-fieldmask so the server
+# drops the deeper levels of the tree before they are serialized and decoded.
+# "word" keeps symbol text (word text is built from it) but not symbol geometry.
+_FIELD_MASKS = {
+    "page": ",".join(_PAGE_FIELDS),
+    "block": ",".join(_BLOCK_FIELDS),
+    "word": ",".join(_WORD_FIELDS),
+    "symbol": None,
+}
+
+
+def check_detail_level(detail_level: str, allowed=DETAIL_LEVELS):
+    """Raise ValueError unless detail_level is one of allowed."""
+    if detail_level not in allowed:
+        raise ValueError(
+            f"Unknown detail level '{detail_level}'. "
+            f"Expected one of: {', '.join(allowed)}"
+        )
+
+
+def field_mask_metadata(detail_level: str):
+    """Call metadata carrying the response field mask for detail_level, if any."""
+    field_mask = _FIELD_MASKS[detail_level]
+    return [("x-goog-fieldmask", field_mask)] if field_mask else ()
+
+
+# ---------------------------------------------------------------------------
+# Shared client
+# ---------------------------------------------------------------------------
+# Built on first use and kept for the life of the process, so every extractor
+# and analyzer created without an explicit client reuses one gRPC channel and
+# one set of credentials instead of bootstrapping them per instance.
+
+@lru_cache(maxsize=1)
+def get_client() -> "vision.ImageAnnotatorClient":
+    return require_vision().ImageAnnotatorClient()
+
+
+# ---------------------------------------------------------------------------
+# Cached batch annotation
+# ---------------------------------------------------------------------------
+
+def annotate_cached(client, sources, features, context, cache, key_fn, parse, metadata=()):
+    """
+    Annotate sources in BatchAnnotateImages calls of up to
+    MAX_IMAGES_PER_REQUEST and convert each response with parse(name, response).
+
+    Each file is read once. When cache is given, key_fn(content) names the
+    cache entry for an image's bytes, and images with a cached result are
+    not sent.
+
+    Returns:
+        One result per source, in order.
+
+    Raises:
+        RuntimeError: If the Vision API returns an error for any image.
+    """
+    vision = require_vision()
+    results = []
+    for start in range(0, len(sources), MAX_IMAGES_PER_REQUEST):
+        chunk = sources[start:start + MAX_IMAGES_PER_REQUEST]
+        images = [load_image(source) for source in chunk]
+        names = [source_name(source) for source in chunk]
+
+        keys = [None] * len(chunk)
+        chunk_results = [None] * len(chunk)
+        if cache is not None:
+            for i, image in enumerate(images):
+                if not image.content:
+                    continue
+                keys[i] = key_fn(image.content)
+                chunk_results[i] = cache.load(keys[i])
+                if chunk_results[i] is not None:
+                    logger.info("Using cached result for: %s", names[i])
+
+        misses = [i for i, result in enumerate(chunk_results) if result is None]
+        if misses:
+            batch = client.batch_annotate_images(
+                requests=[
+                    vision.AnnotateImageRequest(
+                        image=images[i],
+                        features=features,
+                        image_context=context,
+                    )
+                    for i in misses
+                ],
+                metadata=metadata,
+            )
+
+            for i, response in zip(misses, batch.responses):
+                if response.error.message:
+                    raise RuntimeError(
+                        f"Vision API error for {names[i]}: {response.error.message}"
+                    )
+                chunk_results[i] = parse(names[i], response)
+                if keys[i] is not None:
+                    cache.store(keys[i], chunk_results[i])
+
+        results.extend(chunk_results)
+    return results
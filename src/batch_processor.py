@@ -1,20 +1,41 @@
 """
-batch_processor.py - High-volume document automation using thread-pool parallelism.
+batch_processor.py - High-volume document automation using Vision's server-side
+async batch endpoints, with a thread-pool fallback for one-call-per-file processing.
 Processes entire directories with error isolation and JSON reporting.
 """
 
 import json
 import logging
+import os
 import sys
+import threading
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from pathlib import Path
 
+from src._cache import ResultCache, file_digest
+from src._vision import require_vision
 from src.ocr import DocumentExtractor, SUPPORTED_FORMATS
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
 logger = logging.getLogger(__name__)
 
+# Formats annotated as whole files (AsyncBatchAnnotateFiles) rather than images
+FILE_FORMATS = {".pdf": "application/pdf", ".tiff": "image/tiff", ".tif": "image/tiff", ".gif": "image/gif"}
+
+# Vision limits: 2000 images per async image batch, 100 responses per output shard.
+# File batches are kept to MAX_BATCH_FILES so each operation stays bounded.
+MAX_BATCH_IMAGES = 2000
+MAX_BATCH_FILES = 100
+OUTPUT_SHARD_SIZE = 100
+BATCH_TIMEOUT_SECONDS = 1800
+
+# Threads dedicated to JSON serialisation + disk writes in the per-file path
+WRITER_WORKERS = 2
+
+# Result cache directory, under the output directory
+CACHE_DIR_NAME = ".cache"
+
 
 class BatchProcessor:
     """
@@ -23,36 +44,73 @@ class BatchProcessor:
     Processes all supported files in an input directory, saves per-file JSON
     results to an output directory, and writes a summary report on completion.
 
+    When a GCS staging URI is configured, files are uploaded once and annotated
+    by Vision's async batch endpoints (thousands of files per request) instead
+    of one RPC per file.
+
     Usage:
-        processor = BatchProcessor(max_workers=10)
+        processor = BatchProcessor(staging_uri="gs://my-bucket/ocr-staging")
         report = processor.process_directory("./documents", "./results")
     """
 
-    def __init__(self, max_workers: int = 10, language: str = "en"):
+    def __init__(
+        self,
+        max_workers: int = 10,
+        language: str = "en",
+        staging_uri: str = None,
+        cache: bool = True,
+    ):
         """
         Args:
             max_workers: Maximum parallel Vision API threads. Keep ≤ 10 to
                          stay within default quota limits.
             language:    Default BCP-47 language hint for all documents.
+            staging_uri: GCS prefix (e.g. 'gs://bucket/staging') used for batch
+                         inputs and outputs. Required for batch processing.
+            cache:       Reuse results for files whose contents were already
+                         processed, keyed by content hash under
+                         '<output_dir>/.cache'.
+
+        Raises:
+            ValueError: If staging_uri is not a gs:// URI.
         """
+        if staging_uri and not staging_uri.startswith("gs://"):
+            raise ValueError(f"Expected a gs:// staging URI, got: {staging_uri}")
+
         self.extractor = DocumentExtractor()
         self.max_workers = max_workers
         self.language = language
+        self.staging_uri = staging_uri
+        self.cache = cache
+        self.storage_client = None
+        if staging_uri:
+            # Only batch staging needs GCS; keep the import off the default path
+            from google.cloud import storage
+
+            self.storage_client = storage.Client()
+        self._results_lock = threading.Lock()
 
     # ------------------------------------------------------------------
     # Public API
     # ------------------------------------------------------------------
 
-    def process_directory(self, input_dir: str, output_dir: str) -> dict:
+    def process_directory(self, input_dir: str, output_dir: str, batch: bool = None) -> dict:
         """
         Process every supported file in input_dir in parallel.
 
         Args:
             input_dir:  Source directory containing images/PDFs.
             output_dir: Destination directory for JSON results and report.
+            batch:      Use Vision's async batch endpoints. Requires staging_uri,
+                        and defaults to whether one is configured; pass False
+                        to issue one API call per file instead.
 
         Returns:
             Summary dictionary with lists of successful and failed files.
+
+        In batch mode, PDF/TIFF/GIF files are annotated as whole documents and
+        saved in the extract_document() shape (text, confidence, word_count,
+        pages, page_count) rather than extract()'s per-word bounding_boxes.
         """
         input_path = Path(input_dir)
         output_path = Path(output_dir)
@@ -62,37 +120,51 @@ class BatchProcessor:
 
         output_path.mkdir(parents=True, exist_ok=True)
 
-        files = [
-            f for f in input_path.iterdir()
-            if f.is_file() and f.suffix.lower() in SUPPORTED_FORMATS
-        ]
+        # scandir's DirEntry answers is_file() from the directory listing's
+        # d_type, avoiding a stat() per entry on large directories.
+        with os.scandir(input_path) as entries:
+            files = [
+                Path(entry.path) for entry in entries
+                if os.path.splitext(entry.name)[1].lower() in SUPPORTED_FORMATS
+                and entry.is_file()
+            ]
 
         if not files:
             logger.warning(f"No supported files found in: {input_dir}")
             return {"successful": [], "failed": [], "total": 0}
 
-        logger.info(f"Found {len(files)} file(s) to process with {self.max_workers} workers")
-
         results = {"successful": [], "failed": [], "total": len(files)}
         start_time = datetime.utcnow()
-
-        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            future_to_file = {
-                executor.submit(self._process_single, f): f
-                for f in files
-            }
-
-            for future in as_completed(future_to_file):
-                file_path = future_to_file[future]
-                try:
-                    data = future.result()
-                    self._save_result(output_path, file_path, data)
-                    results["successful"].append(str(file_path))
-                    logger.info(f"✓ {file_path.name}")
-                except Exception as exc:
-                    error_info = {"file": str(file_path), "error": str(exc)}
-                    results["failed"].append(error_info)
-                    logger.error(f"✗ {file_path.name}: {exc}")
+        result_cache = ResultCache(output_path / CACHE_DIR_NAME) if self.cache else None
+
+        if batch is None:
+            batch = self.staging_uri is not None
+
+        if batch and self.staging_uri:
+            logger.info(f"Found {len(files)} file(s) to process via async batch annotation")
+            self._process_batch(files, output_path, results, result_cache)
+        else:
+            if batch:
+                logger.warning("No staging_uri configured; falling back to per-file processing")
+            logger.info(f"Found {len(files)} file(s) to process with {self.max_workers} workers")
+
+            # Completed OCR results are handed to a writer pool so JSON
+            # serialisation and disk I/O never stall draining the OCR futures.
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor, \
+                    ThreadPoolExecutor(max_workers=WRITER_WORKERS) as writer:
+                future_to_file = {
+                    executor.submit(self._process_single, f, result_cache): f
+                    for f in files
+                }
+
+                for future in as_completed(future_to_file):
+                    file_path = future_to_file[future]
+                    try:
+                        data = future.result()
+                    except Exception as exc:
+                        self._record_failure(results, file_path, exc)
+                        continue
+                    writer.submit(self._save_and_record, output_path, file_path, data, results)
 
         results["duration_seconds"] = (datetime.utcnow() - start_time).total_seconds()
         results["success_rate"] = (
@@ -119,10 +191,11 @@ class BatchProcessor:
         output_path.mkdir(parents=True, exist_ok=True)
 
         results = {"successful": [], "failed": [], "total": len(file_paths)}
+        result_cache = ResultCache(output_path / CACHE_DIR_NAME) if self.cache else None
 
         with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
             future_to_file = {
-                executor.submit(self._process_single, Path(f)): Path(f)
+                executor.submit(self._process_single, Path(f), result_cache): Path(f)
                 for f in file_paths
             }
 
@@ -142,15 +215,277 @@ class BatchProcessor:
     # Private helpers
     # ------------------------------------------------------------------
 
-    def _process_single(self, file_path: Path) -> dict:
-        """Invoke the extractor for a single file."""
-        return self.extractor.extract(str(file_path), language=self.language)
+    def _process_single(self, file_path: Path, result_cache: ResultCache = None) -> dict:
+        """Run the shared extractor on a single file, via the cache."""
+        key = None
+        if result_cache is not None:
+            key = self._cache_key(file_path, "text")
+            cached = result_cache.load(key)
+            if cached is not None:
+                return cached
+
+        # Worker threads share the extractor's client: gRPC multiplexes their
+        # concurrent calls over one channel, and no client is built per call.
+        data = self.extractor.extract(str(file_path), language=self.language)
+
+        if key is not None:
+            result_cache.store(key, data)
+        return data
+
+    def _process_batch(
+        self, files: list, output_path: Path, results: dict, result_cache: ResultCache = None
+    ):
+        """
+        Stage files in GCS and annotate them with Vision's async batch endpoints.
+
+        Files are uploaded over max_workers threads. Raster images are grouped
+        into AsyncBatchAnnotateImages requests of up to MAX_BATCH_IMAGES;
+        PDF/TIFF/GIF files go through AsyncBatchAnnotateFiles. Every operation
+        is started before any is waited on, so they run concurrently server-side.
+        Per-file results are read back from the JSON shards Vision writes to
+        the staging prefix. Files with a cached result are never staged, and
+        everything staged for the run is deleted once its outcomes are collected.
+        """
+        cache_keys = {}
+        if result_cache is not None:
+            pending = []
+            for file_path in files:
+                feature = "document" if file_path.suffix.lower() in FILE_FORMATS else "text"
+                key = self._cache_key(file_path, feature)
+                cached = result_cache.load(key)
+                if cached is not None:
+                    self._save_and_record(output_path, file_path, cached, results)
+                else:
+                    cache_keys[file_path] = key
+                    pending.append(file_path)
+            files = pending
+
+        bucket_name, _, prefix = self.staging_uri[len("gs://"):].partition("/")
+        run_prefix = "/".join(
+            p for p in (prefix.strip("/"), datetime.utcnow().strftime("%Y%m%dT%H%M%S%f")) if p
+        )
+        bucket = self.storage_client.bucket(bucket_name)
+
+        try:
+            staged = {}
+            with ThreadPoolExecutor(max_workers=self.max_workers) as uploader:
+                future_to_file = {
+                    uploader.submit(self._stage_file, bucket, run_prefix, f): f
+                    for f in files
+                }
+                for future in as_completed(future_to_file):
+                    file_path = future_to_file[future]
+                    try:
+                        staged[file_path] = future.result()
+                    except Exception as exc:
+                        self._record_failure(results, file_path, exc)
+
+            images, documents = [], []
+            for f in files:
+                if f in staged:
+                    (documents if f.suffix.lower() in FILE_FORMATS else images).append(f)
+
+            batches = [
+                (self._submit_images, self._collect_images,
+                 images[i:i + MAX_BATCH_IMAGES], f"{run_prefix}/output/images-{i}/")
+                for i in range(0, len(images), MAX_BATCH_IMAGES)
+            ] + [
+                (self._submit_files, self._collect_files,
+                 documents[i:i + MAX_BATCH_FILES], f"{run_prefix}/output/files-{i}/")
+                for i in range(0, len(documents), MAX_BATCH_FILES)
+            ]
+
+            # Start every operation first; waiting on each before submitting
+            # the next would serialise work Vision can run in parallel.
+            operations = []
+            for submit, collect, chunk, out_prefix in batches:
+                try:
+                    operation = submit(chunk, staged, bucket, out_prefix)
+                except Exception as exc:
+                    operation = exc
+                operations.append((operation, collect, chunk, out_prefix))
+
+            for operation, collect, chunk, out_prefix in operations:
+                try:
+                    if isinstance(operation, Exception):
+                        raise operation
+                    operation.result(timeout=BATCH_TIMEOUT_SECONDS)
+                    outcomes = collect(chunk, staged, bucket, out_prefix)
+                except Exception as exc:
+                    outcomes = {file_path: exc for file_path in chunk}
+
+                for file_path, outcome in outcomes.items():
+                    if isinstance(outcome, Exception):
+                        self._record_failure(results, file_path, outcome)
+                        continue
+                    if file_path in cache_keys:
+                        result_cache.store(cache_keys[file_path], outcome)
+                    self._save_and_record(output_path, file_path, outcome, results)
+        finally:
+            self._delete_staging(bucket, run_prefix)
+
+    @staticmethod
+    def _stage_file(bucket, run_prefix: str, file_path: Path) -> str:
+        """Upload one input file to the run's staging prefix; return its gs:// URI."""
+        blob = bucket.blob(f"{run_prefix}/input/{file_path.name}")
+        blob.upload_from_filename(str(file_path))
+        return f"gs://{bucket.name}/{blob.name}"
+
+    def _submit_images(self, chunk, staged, bucket, out_prefix):
+        """Start one AsyncBatchAnnotateImages operation; return the operation."""
+        vision = require_vision()
+        context = vision.ImageContext(language_hints=[self.language])
+        requests = [
+            vision.AnnotateImageRequest(
+                image=vision.Image(source=vision.ImageSource(gcs_image_uri=staged[f])),
+                features=[vision.Feature(type_=vision.Feature.Type.TEXT_DETECTION)],
+                image_context=context,
+            )
+            for f in chunk
+        ]
+        output_config = vision.OutputConfig(
+            gcs_destination=vision.GcsDestination(uri=f"gs://{bucket.name}/{out_prefix}"),
+            batch_size=OUTPUT_SHARD_SIZE,
+        )
+
+        return self.extractor.client.async_batch_annotate_images(
+            requests=requests, output_config=output_config
+        )
+
+    def _collect_images(self, chunk, staged, bucket, out_prefix) -> dict:
+        """
+        Read a finished image operation's shards.
+
+        Returns:
+            Mapping of file path to its result dict, or to the exception
+            describing why it failed.
+        """
+        vision = require_vision()
+        outcomes = {}
+        pending = {staged[f]: f for f in chunk}
+        for blob in bucket.list_blobs(prefix=out_prefix):
+            shard = vision.BatchAnnotateImagesResponse.from_json(
+                blob.download_as_bytes(), ignore_unknown_fields=True
+            )
+            for response in shard.responses:
+                file_path = pending.pop(response.context.uri, None)
+                if file_path is None:
+                    continue
+                if response.error.message:
+                    outcomes[file_path] = RuntimeError(f"Vision API error: {response.error.message}")
+                else:
+                    outcomes[file_path] = self.extractor.parse_text_response(response)
+
+        for file_path in pending.values():
+            outcomes[file_path] = RuntimeError("No response in batch output")
+        return outcomes
+
+    def _submit_files(self, chunk, staged, bucket, out_prefix):
+        """Start one AsyncBatchAnnotateFiles operation; return the operation."""
+        vision = require_vision()
+        context = vision.ImageContext(language_hints=[self.language])
+        requests = [
+            vision.AsyncAnnotateFileRequest(
+                input_config=vision.InputConfig(
+                    gcs_source=vision.GcsSource(uri=staged[f]),
+                    mime_type=FILE_FORMATS[f.suffix.lower()],
+                ),
+                features=[vision.Feature(type_=vision.Feature.Type.DOCUMENT_TEXT_DETECTION)],
+                image_context=context,
+                output_config=vision.OutputConfig(
+                    gcs_destination=vision.GcsDestination(
+                        uri=f"gs://{bucket.name}/{out_prefix}{i}/"
+                    ),
+                    batch_size=OUTPUT_SHARD_SIZE,
+                ),
+            )
+            for i, f in enumerate(chunk)
+        ]
+
+        return self.extractor.client.async_batch_annotate_files(requests=requests)
+
+    def _collect_files(self, chunk, staged, bucket, out_prefix) -> dict:
+        """
+        Read a finished file operation's per-file shards.
+
+        Returns:
+            Mapping of file path to its result dict, or to the exception
+            describing why it failed.
+        """
+        vision = require_vision()
+        outcomes = {}
+        for i, file_path in enumerate(chunk):
+            try:
+                page_responses = []
+                for blob in bucket.list_blobs(prefix=f"{out_prefix}{i}/"):
+                    shard = vision.AnnotateFileResponse.from_json(
+                        blob.download_as_bytes(), ignore_unknown_fields=True
+                    )
+                    page_responses.extend(shard.responses)
+
+                if not page_responses:
+                    raise RuntimeError("No response in batch output")
+
+                page_responses.sort(key=lambda r: r.context.page_number)
+                for response in page_responses:
+                    if response.error.message:
+                        raise RuntimeError(f"Vision API error: {response.error.message}")
+
+                outcomes[file_path] = self.extractor.parse_document_annotations(
+                    [r.full_text_annotation for r in page_responses]
+                )
+            except Exception as exc:
+                outcomes[file_path] = exc
+        return outcomes
+
+    def _cache_key(self, file_path: Path, feature: str) -> str:
+        """Digest of the file contents, qualified by feature and language hint."""
+        return f"{file_digest(file_path)}-{feature}-{self.language}"
+
+    def _delete_staging(self, bucket, run_prefix: str):
+        """Delete a run's staged inputs and Vision output shards."""
+        try:
+            bucket.delete_blobs(list(bucket.list_blobs(prefix=f"{run_prefix}/")))
+        except Exception as exc:
+            logger.warning(f"Could not delete staging prefix gs://{bucket.name}/{run_prefix}/: {exc}")
+
+    def _save_and_record(self, output_dir: Path, source: Path, data: dict, results: dict):
+        """Writer-pool task: persist one result and record its outcome."""
+        try:
+            self._save_result(output_dir, source, data)
+            self._record_success(results, source)
+        except Exception as exc:
+            self._record_failure(results, source, exc)
+
+    def _record_success(self, results: dict, file_path: Path):
+        with self._results_lock:
+            results["successful"].append(str(file_path))
+        logger.info(f"✓ {file_path.name}")
+
+    def _record_failure(self, results: dict, file_path: Path, exc: Exception):
+        with self._results_lock:
+            results["failed"].append({"file": str(file_path), "error": str(exc)})
+        logger.error(f"✗ {file_path.name}: {exc}")
 
     def _save_result(self, output_dir: Path, source: Path, data: dict):
         """Write per-file JSON result."""
-        output_file = output_dir / f"{source.stem}.json"
-        with open(output_file, "w", encoding="utf-8") as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
+        self._write_json_atomic(output_dir / f"{source.stem}.json", data)
+
+    def _write_json_atomic(self, output_file: Path, data: dict):
+        """
+        Write JSON to output_file atomically.
+
+        The document is encoded in one call and written to a temporary file
+        that replaces the target, so readers never observe a partial result.
+        """
+        tmp_file = output_file.with_name(f".{output_file.name}.{threading.get_ident()}.tmp")
+        blob = json.dumps(data, indent=2, ensure_ascii=False).encode("utf-8")
+        try:
+            tmp_file.write_bytes(blob)
+            os.replace(tmp_file, output_file)
+        except BaseException:
+            tmp_file.unlink(missing_ok=True)
+            raise
 
     def _write_report(self, output_dir: Path, results: dict):
         """Write the processing summary report."""
@@ -183,13 +518,14 @@ class BatchProcessor:
 
 if __name__ == "__main__":
     if len(sys.argv) < 3:
-        print("Usage: python batch_processor.py <input_dir> <output_dir> [max_workers]")
-        print("  Example: python batch_processor.py ./documents ./results 10")
+        print("Usage: python batch_processor.py <input_dir> <output_dir> [max_workers] [staging_uri]")
+        print("  Example: python batch_processor.py ./documents ./results 10 gs://my-bucket/staging")
         sys.exit(1)
 
     input_dir = sys.argv[1]
     output_dir = sys.argv[2]
     max_workers = int(sys.argv[3]) if len(sys.argv) > 3 else 10
+    staging_uri = sys.argv[4] if len(sys.argv) > 4 else None
 
-    processor = BatchProcessor(max_workers=max_workers)
+    processor = BatchProcessor(max_workers=max_workers, staging_uri=staging_uri)
     processor.process_directory(input_dir, output_dir)
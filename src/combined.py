@@ -0,0 +1,105 @@
+"""
+combined.py - Fused OCR, layout, and handwriting analysis in a single Vision request.
+Sends TEXT_DETECTION and DOCUMENT_TEXT_DETECTION as features of one
+AnnotateImageRequest, so workflows that need all three views of an image pay
+one API round-trip instead of three.
+"""
+
+import logging
+from typing import TYPE_CHECKING, NamedTuple
+
+if TYPE_CHECKING:
+    from google.cloud import vision
+
+if __package__:
+    from ._vision import get_client, load_image, require_vision, source_name
+    from .handwriting import HandwritingExtractor
+    from .layout_analyzer import DocumentLayout, LayoutAnalyzer
+    from .ocr import DocumentExtractor
+else:  # run as a script, e.g. python src/combined.py
+    from _vision import get_client, load_image, require_vision, source_name
+    from handwriting import HandwritingExtractor
+    from layout_analyzer import DocumentLayout, LayoutAnalyzer
+    from ocr import DocumentExtractor
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+logger = logging.getLogger(__name__)
+
+
+class CombinedAnalysis(NamedTuple):
+    """Results of analyze_all(), in the shapes returned by the single-feature APIs."""
+
+    text: dict                  # DocumentExtractor.extract()
+    layout: DocumentLayout      # LayoutAnalyzer.analyze()
+    handwriting: dict           # HandwritingExtractor.extract()
+
+
+def analyze_all(
+    image_path,
+    language: str = "en",
+    client: "vision.ImageAnnotatorClient" = None,
+) -> CombinedAnalysis:
+    """
+    Run text, layout, and handwriting extraction with one Vision API call.
+
+    Args:
+        image_path: Path to the image file, or a preloaded vision.Image.
+        language:   BCP-47 language code hint.
+        client:     Optional ImageAnnotatorClient to reuse. The shared
+                    module client is used when omitted.
+
+    Returns:
+        CombinedAnalysis(text, layout, handwriting).
+
+    Raises:
+        FileNotFoundError: If the image file does not exist.
+        RuntimeError: If the Vision API returns an error.
+    """
+    image = load_image(image_path)
+    name = source_name(image_path)
+
+    logger.info("Running combined analysis on: %s", name)
+
+    client = client or get_client()
+    vision = require_vision()
+    request = vision.AnnotateImageRequest(
+        image=image,
+        features=[
+            vision.Feature(type_=vision.Feature.Type.TEXT_DETECTION),
+            vision.Feature(type_=vision.Feature.Type.DOCUMENT_TEXT_DETECTION),
+        ],
+        image_context=vision.ImageContext(language_hints=[language]),
+    )
+    response = client.batch_annotate_images(requests=[request]).responses[0]
+
+    if response.error.message:
+        raise RuntimeError(f"Vision API error: {response.error.message}")
+
+    annotation = response.full_text_annotation
+    return CombinedAnalysis(
+        text=DocumentExtractor.parse_text_response(response),
+        layout=LayoutAnalyzer(client=client).parse_annotation(annotation),
+        handwriting=HandwritingExtractor(client=client).parse_annotation(annotation, name),
+    )
+
+
+# ---------------------------------------------------------------------------
+# CLI entry point
+# ---------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) < 2:
+        print("Usage: python combined.py <image_path> [language_code]")
+        print("  Example: python combined.py samples/invoice.jpg en")
+        sys.exit(1)
+
+    language = sys.argv[2] if len(sys.argv) > 2 else "en"
+    analysis = analyze_all(sys.argv[1], language=language)
+
+    print(f"\n--- Extracted Text ---\n{analysis.text['text']}")
+    print(f"\n--- Stats ---")
+    print(f"Words found     : {analysis.text['word_count']}")
+    print(f"Blocks          : {len(analysis.layout.blocks)}")
+    print(f"Language        : {analysis.handwriting['detected_language']}")
@@ -4,11 +4,27 @@ Uses DOCUMENT_TEXT_DETECTION which performs better on handwritten content than
 the standard text_detection endpoint.
 """
 
-import json
 import logging
 from pathlib import Path
-
-from google.cloud import vision
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from google.cloud import vision
+
+if __package__:
+    from ._cache import ResultCache, content_digest
+    from ._vision import (
+        DETAIL_LEVELS, annotate_cached, check_detail_level,
+        field_mask_metadata, get_client, is_path, load_image, require_vision, source_name,
+        symbol_text,
+    )
+else:  # run as a script, e.g. python src/handwriting.py
+    from _cache import ResultCache, content_digest
+    from _vision import (
+        DETAIL_LEVELS, annotate_cached, check_detail_level,
+        field_mask_metadata, get_client, is_path, load_image, require_vision, source_name,
+        symbol_text,
+    )
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
 logger = logging.getLogger(__name__)
@@ -23,17 +39,35 @@ class HandwritingExtractor:
     → words → symbols) which yields better results on irregular letterforms.
     """
 
-    def __init__(self):
-        self.client = vision.ImageAnnotatorClient()
+    def __init__(
+        self, *, client: "vision.ImageAnnotatorClient" = None, cache_dir: str = None
+    ):
+        """
+        Args:
+            client:    Optional pre-built ImageAnnotatorClient. The module's
+                       shared client is used when omitted.
+            cache_dir: Optional directory for a result cache keyed by image
+                       content and language hints. Repeat extractions of
+                       identical bytes are then served without an API call.
+        """
+        self.client = client or get_client()
+        self.cache = ResultCache(cache_dir) if cache_dir else None
 
-    def extract(self, image_path: str, language_hints: list = None) -> dict:
+    def extract(
+        self, image_path: str, language_hints: list = None, detail_level: str = "symbol"
+    ) -> dict:
         """
         Extract handwritten text with full structural hierarchy.
 
         Args:
-            image_path:     Path to image containing handwritten text.
+            image_path:     Path to image containing handwritten text, or a
+                            preloaded vision.Image.
             language_hints: List of BCP-47 codes, e.g. ['en', 'fr'].
                             Improves accuracy for mixed-language documents.
+            detail_level:   One of DETAIL_LEVELS. The result never reads below
+                            block level, so "block" returns the same result
+                            from a much smaller response; "page" also drops
+                            blocks (block_count is then 0).
 
         Returns:
             Dictionary with extracted text, page stats, block structure,
@@ -41,85 +75,99 @@ class HandwritingExtractor:
 
         Raises:
             FileNotFoundError: If the image file does not exist.
+            ValueError: If detail_level is not one of DETAIL_LEVELS.
             RuntimeError: If the Vision API returns an error.
         """
-        path = Path(image_path)
-        if not path.exists():
-            raise FileNotFoundError(f"File not found: {image_path}")
-
-        logger.info(f"Running handwriting extraction on: {path.name}")
-
-        with open(image_path, "rb") as f:
-            image = vision.Image(content=f.read())
-
-        context = vision.ImageContext(language_hints=language_hints or ["en"])
-        response = self.client.document_text_detection(image=image, image_context=context)
-
-        if response.error.message:
-            raise RuntimeError(f"Vision API error: {response.error.message}")
+        return self.extract_batch(
+            [image_path], language_hints=language_hints, detail_level=detail_level
+        )[0]
 
-        annotation = response.full_text_annotation
-
-        if not annotation.text:
-            logger.warning(f"No handwriting detected in: {path.name}")
-            return {
-                "text": "",
-                "pages": [],
-                "detected_language": "unknown",
-                "confidence": 0.0,
-            }
+    def extract_batch(
+        self, image_paths: list, language_hints: list = None, detail_level: str = "symbol"
+    ) -> list:
+        """
+        Run extract() over several images with one API call per
+        MAX_IMAGES_PER_REQUEST images (BatchAnnotateImages).
 
-        pages = self._parse_pages(annotation.pages)
-        detected_language = self._detect_primary_language(annotation)
+        Args:
+            image_paths:    Paths to images containing handwritten text, or
+                            preloaded vision.Image objects.
+            language_hints: List of BCP-47 codes shared by all images.
+            detail_level:   One of DETAIL_LEVELS, as for extract().
 
-        result = {
-            "text": annotation.text,
-            "pages": pages,
-            "page_count": len(pages),
-            "detected_language": detected_language,
-            "average_confidence": self._average_confidence(pages),
-        }
+        Returns:
+            List of result dictionaries, in the same order as image_paths.
 
-        logger.info(
-            f"Extracted {len(annotation.text.split())} words | "
-            f"Language: {detected_language}"
+        Raises:
+            FileNotFoundError: If any image file does not exist.
+            ValueError: If detail_level is not one of DETAIL_LEVELS.
+            RuntimeError: If the Vision API returns an error for any image.
+        """
+        check_detail_level(detail_level)
+        image_paths = list(image_paths)
+        for image_path in image_paths:
+            if is_path(image_path) and not Path(image_path).exists():
+                raise FileNotFoundError(f"File not found: {image_path}")
+
+        language_hints = language_hints or ["en"]
+        vision = require_vision()
+        if logger.isEnabledFor(logging.INFO):
+            for image_path in image_paths:
+                logger.info("Running handwriting extraction on: %s", source_name(image_path))
+
+        return annotate_cached(
+            self.client,
+            image_paths,
+            [vision.Feature(type_=vision.Feature.Type.DOCUMENT_TEXT_DETECTION)],
+            vision.ImageContext(language_hints=language_hints),
+            self.cache,
+            lambda content: self._cache_key(content, language_hints, detail_level),
+            lambda name, response: self.parse_annotation(
+                response.full_text_annotation, name, detail_level
+            ),
+            metadata=field_mask_metadata(detail_level),
         )
-        return result
 
-    def extract_words_with_positions(self, image_path: str) -> list:
+    def extract_words_with_positions(self, image_path: str, detail_level: str = "symbol") -> list:
         """
         Return individual words with their bounding box coordinates.
         Useful for reconstructing handwritten form fields or labelled data.
 
         Args:
-            image_path: Path to the image file.
+            image_path:   Path to the image file, or a preloaded vision.Image.
+            detail_level: "word" or "symbol". Both return the same words;
+                          "word" asks the API to omit per-symbol geometry,
+                          confidence and language properties.
 
         Returns:
             List of dicts: {text, confidence, bounding_box, page, block, paragraph}.
-        """
-        path = Path(image_path)
-        if not path.exists():
-            raise FileNotFoundError(f"File not found: {image_path}")
-
-        with open(image_path, "rb") as f:
-            image = vision.Image(content=f.read())
 
-        response = self.client.document_text_detection(image=image)
+        Raises:
+            ValueError: If detail_level is not "word" or "symbol".
+        """
+        check_detail_level(detail_level, allowed=("word", "symbol"))
+        image = load_image(image_path)
+        vision = require_vision()
+        request = vision.AnnotateImageRequest(
+            image=image,
+            features=[vision.Feature(type_=vision.Feature.Type.DOCUMENT_TEXT_DETECTION)],
+        )
+        response = self.client.batch_annotate_images(
+            requests=[request], metadata=field_mask_metadata(detail_level)
+        ).responses[0]
 
         if response.error.message:
             raise RuntimeError(f"Vision API error: {response.error.message}")
 
         words = []
+        add_word = words.append
         for page_num, page in enumerate(response.full_text_annotation.pages):
             for block_num, block in enumerate(page.blocks):
                 for para_num, para in enumerate(block.paragraphs):
                     for word in para.words:
-                        word_text = "".join(
-                            symbol.text for symbol in word.symbols
-                        )
-                        words.append(
+                        add_word(
                             {
-                                "text": word_text,
+                                "text": "".join(map(symbol_text, word.symbols)),
                                 "confidence": word.confidence,
                                 "bounding_box": [
                                     {"x": v.x, "y": v.y}
@@ -132,13 +180,78 @@ class HandwritingExtractor:
                         )
         return words
 
+    def parse_annotation(
+        self, annotation, name: str = "<image>", detail_level: str = "symbol"
+    ) -> dict:
+        """
+        Build the extract() result from a DOCUMENT_TEXT_DETECTION
+        full_text_annotation.
+
+        Args:
+            annotation:   full_text_annotation from an AnnotateImageResponse.
+            name:         Label for the source image in log messages.
+            detail_level: Detail level the annotation was requested at. Below
+                          "word" the response has no paragraphs, so the
+                          logged word count is "n/a".
+        """
+        if not annotation.text:
+            logger.warning("No handwriting detected in: %s", name)
+            return {
+                "text": "",
+                "pages": [],
+                "detected_language": "unknown",
+                "confidence": 0.0,
+            }
+
+        pages, detected_language, average_confidence, word_count = self._parse_pages(
+            annotation.pages, count_words=detail_level in ("word", "symbol")
+        )
+
+        result = {
+            "text": annotation.text,
+            "pages": pages,
+            "page_count": len(pages),
+            "detected_language": detected_language,
+            "average_confidence": average_confidence,
+        }
+
+        logger.info(
+            "Extracted %s words | Language: %s",
+            "n/a" if word_count is None else word_count,
+            detected_language,
+        )
+        return result
+
     # ------------------------------------------------------------------
     # Private helpers
     # ------------------------------------------------------------------
 
-    def _parse_pages(self, pages) -> list:
+    @staticmethod
+    def _cache_key(content: bytes, language_hints: list, detail_level: str) -> str:
+        hints = ",".join(language_hints)
+        return f"{content_digest(content)}-DOCUMENT_TEXT_DETECTION-{hints}-{detail_level}"
+
+    def _parse_pages(self, pages, count_words: bool = True) -> tuple:
+        """
+        Summarize pages in a single walk.
+
+        Returns:
+            (page dicts, primary language of the first page or "unknown",
+             average of the non-zero page confidences, word count or None
+             when count_words is False).
+        """
         result = []
+        primary_language = "unknown"
+        confidence_sum = 0.0
+        confidence_count = 0
+        word_count = 0 if count_words else None
         for page in pages:
+            if count_words:
+                # Count word nodes instead of splitting the (possibly multi-MB) text
+                for block in page.blocks:
+                    for para in block.paragraphs:
+                        word_count += len(para.words)
+
             langs = []
             if page.property and page.property.detected_languages:
                 langs = [
@@ -148,31 +261,26 @@ class HandwritingExtractor:
                     }
                     for dl in page.property.detected_languages
                 ]
+                if not result:
+                    primary_language = langs[0]["code"]
+
+            confidence = round(page.confidence, 4)
+            if confidence > 0:
+                confidence_sum += confidence
+                confidence_count += 1
+
             result.append(
                 {
                     "width": page.width,
                     "height": page.height,
                     "block_count": len(page.blocks),
-                    "confidence": round(page.confidence, 4),
+                    "confidence": confidence,
                     "detected_languages": langs,
                 }
             )
-        return result
-
-    def _detect_primary_language(self, annotation) -> str:
-        try:
-            langs = annotation.pages[0].property.detected_languages
-            if langs:
-                return langs[0].language_code
-        except (IndexError, AttributeError):
-            pass
-        return "unknown"
 
-    def _average_confidence(self, pages: list) -> float:
-        if not pages:
-            return 0.0
-        confidences = [p["confidence"] for p in pages if p["confidence"] > 0]
-        return round(sum(confidences) / len(confidences), 4) if confidences else 0.0
+        average = round(confidence_sum / confidence_count, 4) if confidence_count else 0.0
+        return result, primary_language, average, word_count
 
 
 # ---------------------------------------------------------------------------
@@ -190,6 +298,10 @@ if __name__ == "__main__":
     image_path = sys.argv[1]
     langs = sys.argv[2].split(",") if len(sys.argv) > 2 else ["en"]
 
+    if not Path(image_path).exists():
+        print(f"File not found: {image_path}")
+        sys.exit(1)
+
     extractor = HandwritingExtractor()
     result = extractor.extract(image_path, language_hints=langs)
 
@@ -7,16 +7,36 @@ from Vision API bounding-box data.
 import json
 import logging
 from dataclasses import dataclass, field, asdict
+from operator import attrgetter, itemgetter
 from pathlib import Path
-from typing import List, Optional
-
-from google.cloud import vision
+from typing import TYPE_CHECKING, List, Optional
+
+if TYPE_CHECKING:
+    from google.cloud import vision
+
+if __package__:
+    from ._vision import (
+        DETAIL_LEVELS, check_detail_level, field_mask_metadata, get_client,
+        load_image, require_vision, source_name, symbol_text,
+    )
+else:  # run as a script, e.g. python src/layout_analyzer.py
+    from _vision import (
+        DETAIL_LEVELS, check_detail_level, field_mask_metadata, get_client,
+        load_image, require_vision, source_name, symbol_text,
+    )
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
 logger = logging.getLogger(__name__)
 
 
-@dataclass
+# Sort keys evaluated in C rather than through a Python lambda per block.
+_reading_order_key = attrgetter("bounding_box.y_min", "bounding_box.x_min")
+_top_key = attrgetter("bounding_box.y_min")
+
+
+# slots=True: layouts hold one BoundingBox and TextBlock per block, and slotted
+# instances skip the per-object __dict__, cutting memory and allocation cost.
+@dataclass(slots=True)
 class BoundingBox:
     x_min: float
     y_min: float
@@ -50,7 +70,7 @@ class BoundingBox:
         return (self.y_min + self.y_max) / 2
 
 
-@dataclass
+@dataclass(slots=True)
 class TextBlock:
     text: str
     block_type: str
@@ -59,7 +79,7 @@ class TextBlock:
     paragraphs: List[str] = field(default_factory=list)
 
 
-@dataclass
+@dataclass(slots=True)
 class DocumentLayout:
     page_width: int
     page_height: int
@@ -78,62 +98,88 @@ class LayoutAnalyzer:
     - Table region identification (heuristic)
     """
 
-    BLOCK_TYPE_MAP = {
-        0: "UNKNOWN",
-        1: "TEXT",
-        2: "TABLE",
-        3: "PICTURE",
-        4: "RULER",
-        5: "BARCODE",
-    }
+    # Indexed by the Block.BlockType enum value (0..5)
+    BLOCK_TYPES = ("UNKNOWN", "TEXT", "TABLE", "PICTURE", "RULER", "BARCODE")
 
-    def __init__(self):
-        self.client = vision.ImageAnnotatorClient()
+    def __init__(self, client: "vision.ImageAnnotatorClient" = None):
+        """
+        Args:
+            client: Optional pre-built ImageAnnotatorClient. The module's
+                    shared client is used when omitted.
+        """
+        self.client = client or get_client()
 
-    def analyze(self, image_path: str) -> DocumentLayout:
+    def analyze(self, image_path: str, detail_level: str = "symbol") -> DocumentLayout:
         """
         Perform full layout analysis on a document image.
 
         Args:
-            image_path: Path to the document image.
+            image_path:   Path to the document image, or a preloaded vision.Image.
+            detail_level: One of DETAIL_LEVELS. "page" returns page dimensions
+                          only; "block" returns block geometry, type and
+                          confidence without text. Coarser levels ask the API
+                          to omit the rest of the annotation tree.
 
         Returns:
             DocumentLayout with block structure and reading order.
+
+        Raises:
+            ValueError: If detail_level is not one of DETAIL_LEVELS.
         """
-        path = Path(image_path)
-        if not path.exists():
-            raise FileNotFoundError(f"File not found: {image_path}")
+        check_detail_level(detail_level)
 
-        logger.info(f"Analyzing layout of: {path.name}")
+        image = load_image(image_path)
 
-        with open(image_path, "rb") as f:
-            image = vision.Image(content=f.read())
+        logger.info("Analyzing layout of: %s", source_name(image_path))
 
-        response = self.client.document_text_detection(image=image)
+        vision = require_vision()
+        request = vision.AnnotateImageRequest(
+            image=image,
+            features=[vision.Feature(type_=vision.Feature.Type.DOCUMENT_TEXT_DETECTION)],
+        )
+        response = self.client.batch_annotate_images(
+            requests=[request], metadata=field_mask_metadata(detail_level)
+        ).responses[0]
 
         if response.error.message:
             raise RuntimeError(f"Vision API error: {response.error.message}")
 
-        if not response.full_text_annotation.pages:
+        return self.parse_annotation(response.full_text_annotation, detail_level)
+
+    def parse_annotation(self, annotation, detail_level: str = "symbol") -> DocumentLayout:
+        """
+        Build a DocumentLayout from a DOCUMENT_TEXT_DETECTION full_text_annotation.
+
+        Used by analyze() and by callers that already hold a response, such as
+        the fused single-request analysis in combined.py. Levels of the tree
+        below detail_level are not walked.
+        """
+        if not annotation.pages:
             logger.warning("No pages found in document.")
             return DocumentLayout(page_width=0, page_height=0)
 
-        page = response.full_text_annotation.pages[0]
+        page = annotation.pages[0]
         layout = DocumentLayout(
             page_width=page.width,
             page_height=page.height,
         )
 
+        if detail_level == "page":
+            return layout
+
+        with_text = detail_level != "block"
         for block in page.blocks:
-            text_block = self._parse_block(block)
+            text_block = self._parse_block(block, with_text)
             layout.blocks.append(text_block)
 
         layout.blocks = self._sort_reading_order(layout.blocks)
         layout.reading_order = [b.text[:80] for b in layout.blocks if b.text.strip()]
 
         logger.info(
-            f"Found {len(layout.blocks)} block(s) | "
-            f"Page: {layout.page_width}x{layout.page_height}px"
+            "Found %d block(s) | Page: %dx%dpx",
+            len(layout.blocks),
+            layout.page_width,
+            layout.page_height,
         )
         return layout
 
@@ -152,26 +198,30 @@ class LayoutAnalyzer:
             return []
 
         threshold = layout.page_width * tolerance
-        text_blocks = [b for b in layout.blocks if b.block_type == "TEXT"]
 
-        # Sort blocks by horizontal center
-        text_blocks.sort(key=lambda b: b.bounding_box.center_x)
+        # Sort blocks by horizontal center, computing each center only once
+        text_blocks = sorted(
+            ((b.bounding_box.center_x, b) for b in layout.blocks if b.block_type == "TEXT"),
+            key=itemgetter(0),
+        )
 
+        # Keep a running sum of center_x per column so each comparison is O(1)
+        # instead of re-summing the column for every block placed.
         columns: List[List[TextBlock]] = []
-        for block in text_blocks:
-            placed = False
-            for col in columns:
-                col_center = sum(b.bounding_box.center_x for b in col) / len(col)
-                if abs(block.bounding_box.center_x - col_center) <= threshold:
+        column_sums: List[float] = []
+        for center_x, block in text_blocks:
+            for i, col in enumerate(columns):
+                if abs(center_x - column_sums[i] / len(col)) <= threshold:
                     col.append(block)
-                    placed = True
+                    column_sums[i] += center_x
                     break
-            if not placed:
+            else:
                 columns.append([block])
+                column_sums.append(center_x)
 
         # Sort each column top-to-bottom
         for col in columns:
-            col.sort(key=lambda b: b.bounding_box.y_min)
+            col.sort(key=_top_key)
 
         return columns
 
@@ -189,7 +239,7 @@ class LayoutAnalyzer:
                 {
                     "text": b.text[:200],
                     "block_type": b.block_type,
-                    "confidence": b.confidence,
+                    "confidence": round(b.confidence, 4),
                     "bounding_box": asdict(b.bounding_box),
                 }
                 for b in layout.blocks
@@ -201,30 +251,38 @@ class LayoutAnalyzer:
     # Private helpers
     # ------------------------------------------------------------------
 
-    def _parse_block(self, block) -> TextBlock:
-        paragraphs_text = []
-        for para in block.paragraphs:
-            words = []
-            for word in para.words:
-                word_text = "".join(s.text for s in word.symbols)
-                words.append(word_text)
-            paragraphs_text.append(" ".join(words))
+    def _parse_block(self, block, with_text: bool = True) -> TextBlock:
+        paragraphs_text = [
+            " ".join("".join(map(symbol_text, word.symbols)) for word in para.words)
+            for para in block.paragraphs
+        ] if with_text else []
 
         block_text = "\n".join(paragraphs_text)
         bbox = BoundingBox.from_vertices(block.bounding_box.vertices)
-        block_type = self.BLOCK_TYPE_MAP.get(block.block_type, "UNKNOWN")
+        type_index = block.block_type
+        block_type = (
+            self.BLOCK_TYPES[type_index] if 0 <= type_index < len(self.BLOCK_TYPES) else "UNKNOWN"
+        )
 
         return TextBlock(
             text=block_text,
             block_type=block_type,
             bounding_box=bbox,
-            confidence=round(block.confidence, 4),
+            confidence=block.confidence,
             paragraphs=paragraphs_text,
         )
 
     def _sort_reading_order(self, blocks: List[TextBlock]) -> List[TextBlock]:
         """Sort blocks in Western reading order: top-to-bottom, left-to-right."""
-        return sorted(blocks, key=lambda b: (b.bounding_box.y_min, b.bounding_box.x_min))
+        keys = list(map(_reading_order_key, blocks))
+
+        # Vision usually returns blocks in reading order already; one pass over
+        # the precomputed keys detects that and skips the sort.
+        if all(a <= b for a, b in zip(keys, keys[1:])):
+            return blocks
+
+        order = sorted(range(len(blocks)), key=keys.__getitem__)
+        return [blocks[i] for i in order]
 
 
 # ---------------------------------------------------------------------------
@@ -238,6 +296,10 @@ if __name__ == "__main__":
         print("Usage: python layout_analyzer.py <image_path>")
         sys.exit(1)
 
+    if not Path(sys.argv[1]).exists():
+        print(f"File not found: {sys.argv[1]}")
+        sys.exit(1)
+
     analyzer = LayoutAnalyzer()
     layout = analyzer.analyze(sys.argv[1])
 
@@ -1,17 +1,42 @@
 """
 ocr.py - Core extraction engine for Google Cloud Vision AI OCR.
-Handles single document processing with full confidence metrics and spatial data.
+Handles single and multi-document processing with full confidence metrics and
+spatial data.
 """
 
-from google.cloud import vision
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
+from typing import TYPE_CHECKING
 import json
 import logging
+import os
+import uuid
+
+if TYPE_CHECKING:
+    from google.cloud import vision
+
+if __package__:
+    from ._cache import ResultCache, content_digest
+    from ._vision import (
+        MAX_IMAGES_PER_REQUEST, annotate_cached, get_client, is_path, require_vision,
+        source_name,
+    )
+else:  # run as a script, e.g. python src/ocr.py
+    from _cache import ResultCache, content_digest
+    from _vision import (
+        MAX_IMAGES_PER_REQUEST, annotate_cached, get_client, is_path, require_vision,
+        source_name,
+    )
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
 logger = logging.getLogger(__name__)
 
-SUPPORTED_FORMATS = {".jpg", ".jpeg", ".png", ".gif", ".bmp", ".webp", ".tiff", ".tif", ".pdf"}
+SUPPORTED_FORMATS = frozenset(
+    {".jpg", ".jpeg", ".png", ".gif", ".bmp", ".webp", ".tiff", ".tif", ".pdf"}
+)
+
+# Upper bound on waiting for an AsyncBatchAnnotateFiles operation
+ASYNC_TIMEOUT_SECONDS = 1800
 
 
 class DocumentExtractor:
@@ -20,15 +45,27 @@ class DocumentExtractor:
     Supports all Vision-compatible image and PDF formats.
     """
 
-    def __init__(self):
-        self.client = vision.ImageAnnotatorClient()
+    def __init__(
+        self, *, client: "vision.ImageAnnotatorClient" = None, cache_dir: str = None
+    ):
+        """
+        Args:
+            client:    Optional pre-built ImageAnnotatorClient. The module's
+                       shared client is used when omitted.
+            cache_dir: Optional directory for a result cache keyed by file
+                       content, feature and language. Repeat extractions of
+                       identical bytes are then served without an API call.
+        """
+        self.client = client or get_client()
+        self.cache = ResultCache(cache_dir) if cache_dir else None
 
     def extract(self, file_path: str, language: str = "en") -> dict:
         """
         Extract text with confidence metrics and spatial bounding box data.
 
         Args:
-            file_path: Path to the image or document file.
+            file_path: Path to the image or document file, or a preloaded
+                       vision.Image.
             language:  BCP-47 language code hint (e.g. 'en', 'fr', 'de').
 
         Returns:
@@ -39,50 +76,66 @@ class DocumentExtractor:
             FileNotFoundError: If the file does not exist.
             RuntimeError: If the Vision API returns an error.
         """
-        path = Path(file_path)
+        return self.extract_batch([file_path], language=language)[0]
 
-        if not path.exists():
-            raise FileNotFoundError(f"File not found: {file_path}")
+    def extract_batch(self, file_paths: list, language: str = "en") -> list:
+        """
+        Run extract() over several files with one API call per
+        MAX_IMAGES_PER_REQUEST images (BatchAnnotateImages).
 
-        if path.suffix.lower() not in SUPPORTED_FORMATS:
-            raise ValueError(
-                f"Unsupported format '{path.suffix}'. "
-                f"Supported formats: {', '.join(SUPPORTED_FORMATS)}"
-            )
+        Args:
+            file_paths: Paths to image files, or preloaded vision.Image objects.
+            language:   BCP-47 language code hint shared by all files.
 
-        logger.info(f"Extracting text from: {path.name}")
+        Returns:
+            List of result dictionaries, in the same order as file_paths.
 
-        with open(file_path, "rb") as f:
-            image = vision.Image(content=f.read())
+        Raises:
+            ValueError: If any file format is not supported.
+            FileNotFoundError: If any file does not exist.
+            RuntimeError: If the Vision API returns an error for any file.
+        """
+        sources = [self._check_source(p) for p in file_paths]
+        if logger.isEnabledFor(logging.INFO):
+            for source in sources:
+                logger.info("Extracting text from: %s", source_name(source))
 
-        context = vision.ImageContext(language_hints=[language])
-        response = self.client.text_detection(image=image, image_context=context)
+        return self._annotate(
+            sources, require_vision().Feature.Type.TEXT_DETECTION, language, self._text_result
+        )
 
-        if response.error.message:
-            raise RuntimeError(f"Vision API error: {response.error.message}")
+    def extract_many(self, file_paths: list, language: str = "en", max_in_flight: int = 8):
+        """
+        Extract text from many files with several batch requests in flight.
 
-        if not response.text_annotations:
-            logger.warning(f"No text found in: {path.name}")
-            return {"text": "", "confidence": 0, "word_count": 0, "bounding_boxes": []}
+        Files are split into BatchAnnotateImages-sized chunks which run
+        concurrently on a thread pool sharing this extractor's client, so all
+        requests are multiplexed over one gRPC channel.
 
-        full_text = response.text_annotations[0]
+        Args:
+            file_paths:    Paths to image files.
+            language:      BCP-47 language code hint shared by all files.
+            max_in_flight: Maximum concurrent batch requests.
 
-        result = {
-            "text": full_text.description,
-            "confidence": getattr(full_text, "score", None),
-            "word_count": len(response.text_annotations) - 1,
-            "bounding_boxes": [
-                {
-                    "text": word.description,
-                    "vertices": [(v.x, v.y) for v in word.bounding_poly.vertices],
-                    "confidence": getattr(word, "score", None),
-                }
-                for word in response.text_annotations[1:]
-            ],
-        }
+        Yields:
+            (file_path, result) tuples as each chunk completes.
 
-        logger.info(f"Extracted {result['word_count']} words from {path.name}")
-        return result
+        Raises:
+            The first exception raised by a chunk, when its results are reached.
+        """
+        file_paths = list(file_paths)
+        chunks = [
+            file_paths[i:i + MAX_IMAGES_PER_REQUEST]
+            for i in range(0, len(file_paths), MAX_IMAGES_PER_REQUEST)
+        ]
+
+        with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+            future_to_chunk = {
+                executor.submit(self.extract_batch, chunk, language): chunk
+                for chunk in chunks
+            }
+            for future in as_completed(future_to_chunk):
+                yield from zip(future_to_chunk[future], future.result())
 
     def extract_document(self, file_path: str, language: str = "en") -> dict:
         """
@@ -90,60 +143,262 @@ class DocumentExtractor:
         Preferred for invoices, forms, and multi-column layouts.
 
         Args:
-            file_path: Path to the image or document file.
+            file_path: Path to the image or document file, or a preloaded
+                       vision.Image.
             language:  BCP-47 language code hint.
 
         Returns:
             Dictionary with full text, page metadata, and block-level structure.
         """
-        path = Path(file_path)
+        return self.extract_document_batch([file_path], language=language)[0]
 
-        if not path.exists():
-            raise FileNotFoundError(f"File not found: {file_path}")
+    def extract_document_batch(self, file_paths: list, language: str = "en") -> list:
+        """
+        Run extract_document() over several files with one API call per
+        MAX_IMAGES_PER_REQUEST images (BatchAnnotateImages).
 
-        logger.info(f"Running document text detection on: {path.name}")
+        Args:
+            file_paths: Paths to image files, or preloaded vision.Image objects.
+            language:   BCP-47 language code hint shared by all files.
 
-        with open(file_path, "rb") as f:
-            image = vision.Image(content=f.read())
+        Returns:
+            List of result dictionaries, in the same order as file_paths.
+        """
+        sources = [self._check_source(p, check_format=False) for p in file_paths]
+        if logger.isEnabledFor(logging.INFO):
+            for source in sources:
+                logger.info("Running document text detection on: %s", source_name(source))
+
+        return self._annotate(
+            sources,
+            require_vision().Feature.Type.DOCUMENT_TEXT_DETECTION,
+            language,
+            lambda name, response: self.parse_document_annotations([response.full_text_annotation]),
+        )
+
+    def extract_pdf_async(
+        self,
+        gcs_input_uri: str,
+        gcs_output_uri: str,
+        language: str = "en",
+        batch_size: int = 100,
+        mime_type: str = "application/pdf",
+        storage_client=None,
+    ) -> dict:
+        """
+        Run DOCUMENT_TEXT_DETECTION over a multi-page PDF (or TIFF) in GCS with
+        AsyncBatchAnnotateFiles. Vision processes every page server-side and
+        writes JSON shards of batch_size pages under gcs_output_uri, which are
+        then read back and merged in page order. Each call writes to its own
+        '<gcs_output_uri>/<run id>/' sub-prefix, so shards left by earlier
+        runs or sibling prefixes are never merged in.
 
-        context = vision.ImageContext(language_hints=[language])
-        response = self.client.document_text_detection(image=image, image_context=context)
+        Preferred over extract_document() for long documents: nothing is
+        rasterized or uploaded page by page from the client.
 
-        if response.error.message:
-            raise RuntimeError(f"Vision API error: {response.error.message}")
+        Args:
+            gcs_input_uri:  gs:// URI of the source document.
+            gcs_output_uri: gs:// prefix; each call's shards go in a new
+                            sub-prefix under it.
+            language:       BCP-47 language code hint.
+            batch_size:     Pages per output shard (1-100).
+            mime_type:      'application/pdf', 'image/tiff' or 'image/gif'.
+            storage_client: Optional google.cloud.storage.Client used to read
+                            the shards. A new client is created when omitted.
 
-        annotation = response.full_text_annotation
+        Returns:
+            Dictionary in the extract_document() format, covering all pages.
 
-        pages = []
-        for page in annotation.pages:
-            detected_langs = []
-            if page.property and page.property.detected_languages:
-                detected_langs = [
-                    {"language_code": dl.language_code, "confidence": dl.confidence}
-                    for dl in page.property.detected_languages
-                ]
-
-            pages.append(
+        Raises:
+            ValueError: If gcs_output_uri is not a gs:// URI.
+            RuntimeError: If the Vision API returns an error for any page, or
+                          the operation produced no output.
+        """
+        if not gcs_output_uri.startswith("gs://"):
+            raise ValueError(f"Expected a gs:// output URI, got: {gcs_output_uri}")
+
+        vision = require_vision()
+        logger.info("Running async document text detection on: %s", gcs_input_uri)
+
+        output_uri = f"{gcs_output_uri.rstrip('/')}/{uuid.uuid4().hex}/"
+
+        request = vision.AsyncAnnotateFileRequest(
+            input_config=vision.InputConfig(
+                gcs_source=vision.GcsSource(uri=gcs_input_uri),
+                mime_type=mime_type,
+            ),
+            features=[vision.Feature(type_=vision.Feature.Type.DOCUMENT_TEXT_DETECTION)],
+            image_context=vision.ImageContext(language_hints=[language]),
+            output_config=vision.OutputConfig(
+                gcs_destination=vision.GcsDestination(uri=output_uri),
+                batch_size=batch_size,
+            ),
+        )
+        operation = self.client.async_batch_annotate_files(requests=[request])
+        operation.result(timeout=ASYNC_TIMEOUT_SECONDS)
+
+        if storage_client is None:
+            from google.cloud import storage
+
+            storage_client = storage.Client()
+
+        bucket_name, _, prefix = output_uri[len("gs://"):].partition("/")
+        page_responses = []
+        for blob in storage_client.list_blobs(bucket_name, prefix=prefix):
+            shard = vision.AnnotateFileResponse.from_json(
+                blob.download_as_bytes(), ignore_unknown_fields=True
+            )
+            page_responses.extend(shard.responses)
+
+        if not page_responses:
+            raise RuntimeError(f"No output found under {output_uri}")
+
+        page_responses.sort(key=lambda r: r.context.page_number)
+        for response in page_responses:
+            if response.error.message:
+                raise RuntimeError(
+                    f"Vision API error for {gcs_input_uri} page "
+                    f"{response.context.page_number}: {response.error.message}"
+                )
+
+        result = self.parse_document_annotations(
+            [response.full_text_annotation for response in page_responses]
+        )
+        logger.info("Extracted %d page(s) from %s", result["page_count"], gcs_input_uri)
+        return result
+
+    @staticmethod
+    def parse_text_response(response) -> dict:
+        """
+        Convert a TEXT_DETECTION AnnotateImageResponse into a result dictionary.
+
+        Shared by extract() and the batch paths, which receive the same
+        response protos from the server-side batch endpoints.
+        """
+        if not response.text_annotations:
+            return {"text": "", "confidence": 0, "word_count": 0, "bounding_boxes": []}
+
+        full_text = response.text_annotations[0]
+
+        return {
+            "text": full_text.description,
+            "confidence": getattr(full_text, "score", None),
+            "word_count": len(response.text_annotations) - 1,
+            "bounding_boxes": [
                 {
-                    "width": page.width,
-                    "height": page.height,
-                    "block_count": len(page.blocks),
-                    "confidence": page.confidence,
-                    "detected_languages": detected_langs,
+                    "text": word.description,
+                    "vertices": [(v.x, v.y) for v in word.bounding_poly.vertices],
+                    "confidence": getattr(word, "score", None),
                 }
-            )
+                for word in response.text_annotations[1:]
+            ],
+        }
+
+    @staticmethod
+    def parse_document_annotations(annotations) -> dict:
+        """
+        Convert one or more full_text_annotation protos into a result dictionary.
+
+        A single image yields one annotation; multi-page files processed by
+        AsyncBatchAnnotateFiles yield one annotation per page, in page order.
+        confidence is the mean page confidence, so documents carry the same
+        text/confidence/word_count summary as extract() results.
+        """
+        pages = []
+        word_count = 0
+        for annotation in annotations:
+            for page in annotation.pages:
+                word_count += sum(
+                    len(para.words) for block in page.blocks for para in block.paragraphs
+                )
+                detected_langs = []
+                if page.property and page.property.detected_languages:
+                    detected_langs = [
+                        {"language_code": dl.language_code, "confidence": dl.confidence}
+                        for dl in page.property.detected_languages
+                    ]
+
+                pages.append(
+                    {
+                        "width": page.width,
+                        "height": page.height,
+                        "block_count": len(page.blocks),
+                        "confidence": page.confidence,
+                        "detected_languages": detected_langs,
+                    }
+                )
 
         return {
-            "text": annotation.text,
+            "text": "".join(annotation.text for annotation in annotations),
+            "confidence": sum(p["confidence"] for p in pages) / len(pages) if pages else 0,
+            "word_count": word_count,
             "pages": pages,
             "page_count": len(pages),
         }
 
-    def save_result(self, result: dict, output_path: str):
-        """Persist extraction result to a JSON file."""
-        with open(output_path, "w", encoding="utf-8") as f:
-            json.dump(result, f, indent=2, ensure_ascii=False)
-        logger.info(f"Result saved to: {output_path}")
+    def save_result(self, result: dict, output_path: str, indent: int = 2):
+        """
+        Persist extraction result to a JSON file.
+
+        The document is encoded in one json.dumps() call and written with a
+        single write, rather than streamed through json.dump() in many small
+        writes. Pass indent=None for large results: compact output lets the
+        stdlib use its C encoder instead of the pure-Python indenting one.
+        """
+        payload = json.dumps(result, indent=indent, ensure_ascii=False)
+        Path(output_path).write_bytes(payload.encode("utf-8"))
+        logger.info("Result saved to: %s", output_path)
+
+    # ------------------------------------------------------------------
+    # Private helpers
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _check_source(file_path, check_format: bool = True):
+        """Validate a file path (returned as a Path); vision.Image passes through."""
+        if not is_path(file_path):
+            return file_path
+
+        # Check the extension on the string form first: splitext is cheaper
+        # than Path.suffix and rejects bad formats before touching the disk.
+        if check_format:
+            suffix = os.path.splitext(os.fspath(file_path))[1]
+            if suffix.lower() not in SUPPORTED_FORMATS:
+                raise ValueError(
+                    f"Unsupported format '{suffix}'. "
+                    f"Supported formats: {', '.join(sorted(SUPPORTED_FORMATS))}"
+                )
+
+        path = Path(file_path)
+        if not path.exists():
+            raise FileNotFoundError(f"File not found: {file_path}")
+        return path
+
+    def _annotate(self, sources: list, feature_type, language: str, build) -> list:
+        """Annotate sources with one feature via the cache; see annotate_cached()."""
+        vision = require_vision()
+        return annotate_cached(
+            self.client,
+            sources,
+            [vision.Feature(type_=feature_type)],
+            vision.ImageContext(language_hints=[language]),
+            self.cache,
+            lambda content: self._cache_key(content, feature_type, language),
+            build,
+        )
+
+    def _text_result(self, name: str, response) -> dict:
+        if not response.text_annotations:
+            logger.warning("No text found in: %s", name)
+
+        result = self.parse_text_response(response)
+        logger.info("Extracted %d words from %s", result["word_count"], name)
+        return result
+
+    @staticmethod
+    def _cache_key(content: bytes, feature_type, language: str) -> str:
+        feature = require_vision().Feature.Type(feature_type).name
+        return f"{content_digest(content)}-{feature}-{language}"
 
 
 # ---------------------------------------------------------------------------
@@ -161,6 +416,10 @@ if __name__ == "__main__":
     file_path = sys.argv[1]
     language = sys.argv[2] if len(sys.argv) > 2 else "en"
 
+    if not Path(file_path).exists():
+        print(f"File not found: {file_path}")
+        sys.exit(1)
+
     extractor = DocumentExtractor()
     result = extractor.extract(file_path, language=language)
 